@@ -5,9 +5,16 @@ Description: This module contains the Frame class which is used to display image
 Author: Nandu Jagdish
 """
 
+import queue
+import threading
+import weakref
+
 import cv2
 import numpy as np
 
+RENDER_TARGETS = ("bgr", "mask", "label")
+LABEL_DTYPES = (np.uint16, np.int32)
+
 class Frame():
     """
     A class to represent a frame for displaying images using OpenCV.
@@ -21,9 +28,19 @@ class Frame():
     window_name : str
         The name of the window where the frame will be displayed.
     frame : np.ndarray
-        The image data for the frame.
+        The image data for the frame. Allocated once and reused on every refresh.
+    render_target : str
+        What is rendered into the frame. "bgr" (default) is the colour image, "mask" a 1-channel uint8
+        occupancy mask (255 where any shape is) and "label" a 1-channel label map where every pixel holds
+        the index of the topmost shape in list_of_shapes plus one (0 is background).
     list_of_shapes : list
         A list of shapes to be displayed
+    sprite_cache : SpriteCache
+        If set, repeated shapes are drawn from pre-rasterized stamps, see sprites.SpriteCache.
+    double_buffered : bool
+        If True, show() hands a snapshot of the scene to a background render thread instead of rasterizing
+        on the caller's thread. The window is still only touched by the caller's thread, as HighGUI is not
+        thread safe.
 
     Methods
     -------
@@ -39,15 +56,37 @@ class Frame():
         Removes a shape from the frame.
     refresh():
         Refreshes the frame by clearing the image data and redrawing all shapes.
+    transform(shape_ids, affine_matrix):
+        Applies one 2x3 affine matrix to many shapes at once.
+    hit_test(points, processes=None):
+        Returns the topmost shape containing each point.
+    overlapping_pairs(processes=None):
+        Returns all pairs of overlapping shapes.
+    set_render_target(render_target, out=None, label_dtype=np.int32):
+        Selects what is rendered and optionally the buffer it is rendered into.
+    submit():
+        Hands a snapshot of the scene to the render thread (double buffered mode).
+    flush():
+        Blocks until every submitted snapshot has been rendered.
+    stop():
+        Stops the render thread.
     __del__():
         Cleans up the window when the object is destroyed.
     """
-    def __init__(self, width, height,window_name="Frame"):
+    def __init__(self, width, height,window_name="Frame", double_buffered=False, render_target="bgr", out=None, label_dtype=np.int32, sprite_cache=None):
         self.width = width
         self.height = height
         self.window_name = window_name
-        self.frame = np.zeros((height, width, 3), np.uint8)
         self.list_of_shapes = []
+        self.double_buffered = double_buffered
+        self.sprite_cache = sprite_cache
+        # Render thread state, only used in double buffered mode. The back buffer is
+        # private to the render thread, self.frame is the front buffer.
+        self._back_buffer = None
+        self._swap_lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=1)
+        self._render_thread = None
+        self.set_render_target(render_target, out, label_dtype)
         cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
 
 
@@ -59,16 +98,32 @@ class Frame():
         -------
         np.ndarray
             The image data for the frame.
+
+        NOTE: In double buffered mode this is the last completed frame. Unless a buffer was given with out=
+        (see set_render_target), the array is reused as the back buffer after the next swap, copy it if it has
+        to outlive the next frame.
        
         """
-        return self.frame
+        with self._swap_lock:
+            return self.frame
 
     def show(self):
         """
         Refreshed and displays the frame in a window.
+
+        In double buffered mode the frame is only submitted to the render thread, see submit(), and the last
+        frame the render thread completed is displayed without waiting for the new one.
         """
+        if self.double_buffered:
+            self.submit()
+            with self._swap_lock:
+                # copied, the front buffer becomes the back buffer at the next swap
+                image = self._display_image(self.frame).copy()
+            cv2.imshow(self.window_name, image)
+            cv2.waitKey(1)
+            return
         self.refresh()
-        cv2.imshow(self.window_name, self.frame)
+        cv2.imshow(self.window_name, self._display_image(self.frame))
         cv2.waitKey(0)
         # cv2.destroyAllWindows()
 
@@ -87,8 +142,39 @@ class Frame():
         """
         Draws all the shapes on the frame.
         """
-        for shape in self.list_of_shapes:
-            shape.draw(self.frame)
+        self._rasterize(self.frame, self.list_of_shapes)
+
+    def _rasterize(self, buffer, shapes):
+        """
+        Draws the given shapes on the given buffer.
+
+        For the mask and label targets the colour of every shape is replaced by 255 or by its label.
+        """
+        if self.render_target == "bgr":
+            colours = None
+        elif self.render_target == "mask":
+            colours = [255] * len(shapes)
+        else:
+            if len(shapes) > np.iinfo(buffer.dtype).max:
+                raise ValueError(f"{len(shapes)} shapes do not fit in a {buffer.dtype} label map")
+            colours = range(1, len(shapes) + 1)
+        if self.sprite_cache is not None:
+            self.sprite_cache.draw_shapes(shapes, buffer, colours)
+        elif colours is None:
+            for shape in shapes:
+                shape.draw(buffer)
+        else:
+            for shape, colour in zip(shapes, colours):
+                shape.draw(buffer, colour)
+
+    def _display_image(self, buffer):
+        """
+        Returns an image of the buffer that cv2.imshow can display. Label maps are scaled to 8 bit.
+        """
+        if self.render_target == "label":
+            return cv2.normalize(buffer, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+        return buffer
+
     def remove_shape(self, shape):
         """
         Removes a shape from the frame.
@@ -100,18 +186,202 @@ class Frame():
         """
         self.list_of_shapes.remove(shape)
 
+    def transform(self, shape_ids, affine_matrix):
+        """
+        Applies one 2x3 affine matrix to many shapes at once.
+
+        The shapes are grouped by class and every class transforms its group in one vectorized
+        pass (see Shape.transform_many), instead of one Python call per shape.
+
+        Parameters
+        ----------
+        shape_ids : iterable of int or None
+            Indices into list_of_shapes of the shapes to transform. None transforms all shapes.
+        affine_matrix : np.ndarray
+            The 2x3 affine matrix, e.g. from shapes.rotation_matrix().
+        """
+        affine_matrix = np.asarray(affine_matrix, dtype=np.float64)
+        if affine_matrix.shape != (2, 3):
+            raise ValueError(f"Expected a 2x3 affine matrix, got shape {affine_matrix.shape}")
+        if shape_ids is None:
+            shapes = self.list_of_shapes
+        else:
+            shapes = [self.list_of_shapes[shape_id] for shape_id in shape_ids]
+        by_class = {}
+        for shape in shapes:
+            by_class.setdefault(type(shape), []).append(shape)
+        for shape_class, group in by_class.items():
+            shape_class.transform_many(group, affine_matrix)
+
+    def hit_test(self, points, processes=None):
+        """
+        Returns for every point the index in list_of_shapes of the topmost shape containing it, or -1.
+
+        Large queries are sharded over a pool of processes, see parallel.SceneQueries. Use SceneQueries
+        directly to run several queries on one packed copy of the scene.
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (n, 2) array of point coordinates.
+        processes : int, optional
+            The number of worker processes. Defaults to the number of CPUs.
+        """
+        # imported here because parallel imports shapes, which imports this module
+        from parallel import SceneQueries
+        with SceneQueries(self.list_of_shapes, processes) as queries:
+            return queries.hit_test(points)
+
+    def overlapping_pairs(self, processes=None):
+        """
+        Returns an (n, 2) array of all (i, j) pairs of indices into list_of_shapes of shapes that overlap, with i < j.
+
+        Large scenes are sharded over a pool of processes, see parallel.SceneQueries.
+
+        Parameters
+        ----------
+        processes : int, optional
+            The number of worker processes. Defaults to the number of CPUs.
+        """
+        from parallel import SceneQueries
+        with SceneQueries(self.list_of_shapes, processes) as queries:
+            return queries.overlapping_pairs()
+
     def refresh(self):
         """
         Refreshes the frame by clearing the image data and redrawing all shapes.
         """
-        self.frame = np.zeros((self.height, self.width, 3), np.uint8)
+        self.frame.fill(0)
         self.draw_shapes()
 
+    def set_render_target(self, render_target, out=None, label_dtype=np.int32):
+        """
+        Selects what is rendered and the buffer it is rendered into.
+
+        Parameters
+        ----------
+        render_target : str
+            One of "bgr", "mask" or "label".
+        out : np.ndarray, optional
+            A preallocated buffer to render into, e.g. a view on shared memory. It is reused for every frame.
+            Must be (height, width, 3) uint8 for "bgr", (height, width) uint8 for "mask" and (height, width)
+            uint16 or int32 for "label". If None a buffer is allocated.
+        label_dtype : np.dtype, optional
+            The dtype of the label map when no buffer is given. Either np.uint16 or np.int32 (default).
+
+        Raises
+        ------
+        ValueError
+            If the render target is unknown or the buffer does not match it.
+
+        NOTE: In double buffered mode a second buffer like out is allocated as back buffer. A given out stays
+        the front buffer, every completed frame is copied into it instead of swapping the buffers, so it always
+        holds the latest completed frame.
+        """
+        if render_target not in RENDER_TARGETS:
+            raise ValueError(f"Unknown render target {render_target!r}, expected one of {RENDER_TARGETS}")
+        if render_target == "bgr":
+            shape, dtype = (self.height, self.width, 3), np.dtype(np.uint8)
+        elif render_target == "mask":
+            shape, dtype = (self.height, self.width), np.dtype(np.uint8)
+        else:
+            shape = (self.height, self.width)
+            dtype = np.dtype(out.dtype if out is not None else label_dtype)
+            if dtype not in LABEL_DTYPES:
+                raise ValueError(f"Label maps must be uint16 or int32, got {dtype}")
+        # a given buffer is read by others, so it has to stay the front buffer
+        fixed_front = out is not None
+        if out is None:
+            out = np.zeros(shape, dtype)
+        elif out.shape != shape or out.dtype != dtype:
+            raise ValueError(f"Buffer of shape {out.shape} and dtype {out.dtype} does not match render target {render_target!r}, expected {shape} {dtype}")
+        # let a running render thread finish with the old buffers before replacing them
+        self.flush()
+        with self._swap_lock:
+            self.render_target = render_target
+            self.frame = out
+            self._fixed_front = fixed_front
+            if self._back_buffer is not None:
+                self._back_buffer = np.zeros_like(out)
+
+    def submit(self):
+        """
+        Hands a snapshot of the current scene to the render thread.
+
+        Every shape is copied with snapshot() on the caller's thread, so the rendered frame never sees
+        shapes that are updated afterwards. Only one snapshot can be waiting at a time: if the render thread
+        is still busy with the previous one this blocks until it is picked up, so no frame is dropped.
+        """
+        snapshot = [shape.snapshot() for shape in self.list_of_shapes]
+        if self._render_thread is None or not self._render_thread.is_alive():
+            self._back_buffer = np.zeros_like(self.frame)
+            # the thread only gets a weak reference, so it does not keep the frame alive and __del__ can stop it
+            self._render_thread = threading.Thread(target=Frame._render_loop, args=(weakref.ref(self), self._pending), name=f"{self.window_name}-render", daemon=True)
+            self._render_thread.start()
+        self._pending.put(snapshot)
+
+    @staticmethod
+    def _render_loop(frame_ref, pending):
+        """
+        Body of the render thread. Takes snapshots from the pending queue and renders them with _render() until
+        it gets a None snapshot or the frame is gone. The frame is only referenced while a snapshot is rendered.
+        """
+        while True:
+            snapshot = pending.get()
+            try:
+                frame = frame_ref()
+                if snapshot is None or frame is None:
+                    return
+                frame._render(snapshot)
+            finally:
+                # snapshot shapes reference the frame as well
+                frame = snapshot = None
+                pending.task_done()
+
+    def _render(self, snapshot):
+        """
+        Rasterizes a snapshot into the back buffer and swaps it with the front buffer, on the render thread. The
+        front buffer is displayed by show() on the caller's thread.
+        """
+        self._back_buffer.fill(0)
+        self._rasterize(self._back_buffer, snapshot)
+        with self._swap_lock:
+            if self._fixed_front:
+                np.copyto(self.frame, self._back_buffer)
+            else:
+                self.frame, self._back_buffer = self._back_buffer, self.frame
+
+    def flush(self):
+        """
+        Blocks until every submitted snapshot has been rendered into the front buffer.
+        """
+        if self._render_thread is not None:
+            self._pending.join()
+
+    def stop(self):
+        """
+        Renders whatever is still pending and stops the render thread.
+        """
+        if self._render_thread is None:
+            return
+        if self._render_thread is threading.current_thread():
+            # __del__ can run on the render thread when it drops the last reference to the frame, it must not
+            # wait for itself. A full queue also ends the loop, as the frame is gone when it takes the next one.
+            try:
+                self._pending.put_nowait(None)
+            except queue.Full:
+                pass
+        else:
+            self._pending.put(None)
+            self._render_thread.join()
+        self._render_thread = None
+
     def __del__(self):
         """
         Cleans up the window when the object is destroyed.
         """
         # cv2.destroyAllWindows()
+        self.stop()
         print("Destroying window")
         cv2.destroyWindow(self.window_name)
 
@@ -0,0 +1,629 @@
+"""
+Module Name: parallel.py
+Description: This module runs scene wide contains and overlap queries on a pool of processes. The shapes of a frame
+are packed once into flat numpy arrays with a uniform grid over their bounds, the arrays are placed in shared memory
+and the workers only receive index ranges, so no shape is ever pickled.
+
+Author: Nandu Jagdish
+"""
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from shapes import CIRCLE_OUTLINE_POINTS, EDGE_TOLERANCE, Circle, Group, Polygon, _circle_outlines, _ray_crossings, _segment_distances
+
+CIRCLE = 0
+POLYGON = 1
+# below this many points (hit_test) or shapes (overlapping_pairs) starting workers costs more than it saves
+MIN_PARALLEL_SIZE = 20000
+# points per vectorized step in hit_test and rows per vectorized step of the exact overlap tests,
+# bound the size of the temporary arrays
+CHUNK_SIZE = 4096
+NARROW_PHASE_ROWS = 1 << 20
+MAX_GRID_CELLS_PER_AXIS = 1024
+FIELDS = ("kinds", "owners", "bounds", "circles", "offsets", "vertices", "grid", "cell_offsets", "cell_items")
+
+# arrays attached by a worker process, see _attach_worker()
+_worker_state = {}
+
+
+class PackedScene():
+    """
+    The geometry of a list of shapes packed into flat numpy arrays.
+
+    Groups are flattened into their shapes in frame coordinates. Circles are stored as (x, y, radius), polygons as
+    the triangles of their triangulation and all other shapes as convex polygons through their get_points(), so
+    every packed polygon is convex.
+
+    Attributes
+    ----------
+    kinds : np.ndarray
+        CIRCLE or POLYGON for every packed shape.
+    owners : np.ndarray
+        The index of the shape in the original list, which for shapes of a group is the index of the group.
+    bounds : np.ndarray
+        (n, 4) bounds (xmin, ymin, xmax, ymax) of every packed shape.
+    circles : np.ndarray
+        (n, 3) center and radius, only meaningful for circles.
+    offsets : np.ndarray
+        (n + 1,) offsets into vertices, the vertices of shape i are vertices[offsets[i]:offsets[i + 1]].
+    vertices : np.ndarray
+        (v, 2) vertices of all polygons.
+    grid : np.ndarray
+        (x0, y0, cell_width, cell_height, cells_x, cells_y) of the uniform grid over the scene.
+    cell_offsets : np.ndarray
+        Offsets into cell_items, the shapes overlapping cell c are cell_items[cell_offsets[c]:cell_offsets[c + 1]].
+    cell_items : np.ndarray
+        Indices of packed shapes, sorted by cell.
+
+    Methods
+    -------
+    from_shapes(shapes):
+        Packs a list of shapes.
+    arrays():
+        Returns all arrays by name.
+    """
+    def __init__(self, **arrays):
+        for field in FIELDS:
+            setattr(self, field, arrays[field])
+
+    @classmethod
+    def from_shapes(cls, shapes):
+        """
+        Packs a list of shapes, e.g. Frame.list_of_shapes.
+
+        Parameters
+        ----------
+        shapes : list of Shape
+            The shapes to pack.
+
+        Returns
+        -------
+        PackedScene
+            The packed shapes.
+        """
+        owners, kinds, circles, polygons, bounds = [], [], [], [], []
+        for index, shape in enumerate(shapes):
+            for leaf in shape.get_world_shapes() if isinstance(shape, Group) else [shape]:
+                if isinstance(leaf, Circle):
+                    parts = [None]
+                    circles.append((leaf.center.x, leaf.center.y, leaf.radius))
+                    bounds.append(leaf.get_bounds())
+                else:
+                    parts = list(leaf._vertices[leaf.triangles]) if isinstance(leaf, Polygon) else [np.asarray(leaf.get_points(), dtype=np.float64).reshape(-1, 2)]
+                    circles.extend([(0.0, 0.0, 0.0)] * len(parts))
+                    polygons.extend(parts)
+                    bounds.extend((*part.min(axis=0), *part.max(axis=0)) for part in parts)
+                kinds.extend([CIRCLE if part is None else POLYGON for part in parts])
+                owners.extend([index] * len(parts))
+        kinds = np.array(kinds, dtype=np.int8)
+        vertex_counts = np.zeros(len(kinds), dtype=np.int64)
+        vertex_counts[kinds == POLYGON] = [len(polygon) for polygon in polygons]
+        circles = np.array(circles, dtype=np.float64).reshape(-1, 3)
+        bounds = np.array(bounds, dtype=np.float64).reshape(-1, 4)
+        grid, cell_offsets, cell_items = _build_grid(bounds)
+        return cls(kinds=kinds,
+                   owners=np.array(owners, dtype=np.int64),
+                   bounds=bounds,
+                   circles=circles,
+                   offsets=np.concatenate([[0], np.cumsum(vertex_counts)]).astype(np.int64),
+                   vertices=np.concatenate(polygons).astype(np.float64) if polygons else np.zeros((0, 2), dtype=np.float64),
+                   grid=grid,
+                   cell_offsets=cell_offsets,
+                   cell_items=cell_items)
+
+    def arrays(self):
+        """
+        Returns all arrays of the scene by name.
+        """
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+class SharedArrays():
+    """
+    Copies numpy arrays into shared memory blocks that worker processes can attach to by name.
+
+    Attributes
+    ----------
+    spec : tuple
+        (name, block name, shape, dtype) of every array. Small and cheap to pickle.
+    arrays : dict
+        The arrays in shared memory by name.
+
+    Methods
+    -------
+    attach(spec):
+        Attaches to the blocks of a spec in another process.
+    close():
+        Releases and removes the shared memory blocks.
+    """
+    def __init__(self, arrays):
+        self._blocks = []
+        self.arrays = {}
+        spec = []
+        for name, array in arrays.items():
+            # zero sized blocks are not allowed
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self._blocks.append(block)
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            view[...] = array
+            self.arrays[name] = view
+            spec.append((name, block.name, array.shape, array.dtype.str))
+        self.spec = tuple(spec)
+
+    @staticmethod
+    def attach(spec):
+        """
+        Attaches to the shared memory blocks of a spec.
+
+        Returns
+        -------
+        tuple
+            (arrays by name, blocks). The blocks must be kept alive as long as the arrays are used.
+        """
+        arrays, blocks = {}, []
+        for name, block_name, shape, dtype in spec:
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        return arrays, blocks
+
+    def close(self):
+        """
+        Releases and removes the shared memory blocks.
+        """
+        self.arrays = {}
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SceneQueries():
+    """
+    Runs scene wide queries over a fixed snapshot of a list of shapes, on a pool of processes for large inputs.
+
+    The shapes are packed once when the object is created. The first large query copies the packed arrays
+    into shared memory and starts the pool, and later queries reuse both. Small queries run in the calling process
+    on the same packed arrays. Later changes to the shapes are not seen, create a new object for those.
+
+    The results are the same as those of Shape.contains and Shape.overlaps for the same shapes, with these
+    differences:
+
+    - hit_test counts points on the outline of a shape as inside, and tests circles against the polygon of
+      Circle.get_points(), like Circle.contains.
+    - overlapping_pairs tests circles exactly, where Shape.overlaps approximates them by the polygon of
+      Circle.get_points() or, in Circle.overlaps with a rectangle, only tests the corners and the center. Shapes
+      that only touch do not overlap, like in Circle.overlaps and cv2.intersectConvexConvex, also for Polygon,
+      whose overlaps counts touching outlines.
+    - Shapes of a rotated or scaled group are tested as the rounded snapshots of Group.get_world_shapes().
+
+    Attributes
+    ----------
+    scene : PackedScene
+        The packed shapes.
+    processes : int
+        The number of worker processes.
+    min_parallel_size : int
+        Queries smaller than this run in the calling process.
+
+    Methods
+    -------
+    hit_test(points):
+        Returns the topmost shape containing each point.
+    overlapping_pairs():
+        Returns all pairs of overlapping shapes.
+    close():
+        Stops the pool and releases the shared memory.
+    """
+    def __init__(self, shapes, processes=None, min_parallel_size=MIN_PARALLEL_SIZE):
+        """
+        Packs the shapes.
+
+        Parameters
+        ----------
+        shapes : list of Shape
+            The shapes to query, e.g. Frame.list_of_shapes. Results refer to indices into this list.
+        processes : int, optional
+            The number of worker processes. Defaults to the number of CPUs.
+        min_parallel_size : int, optional
+            Queries with fewer points or shapes than this run in the calling process.
+        """
+        self.scene = PackedScene.from_shapes(shapes)
+        self.processes = processes or os.cpu_count() or 1
+        self.min_parallel_size = min_parallel_size
+        self._shared = None
+        self._pool = None
+
+    def _use_pool(self, size):
+        """
+        Returns True if a query of the given size should run on the pool.
+        """
+        return self.processes > 1 and size >= self.min_parallel_size
+
+    def _get_pool(self):
+        """
+        Returns the pool, copying the scene into shared memory and starting the workers on first use.
+        """
+        if self._pool is None:
+            self._shared = SharedArrays(self.scene.arrays())
+            self._pool = multiprocessing.get_context().Pool(self.processes, initializer=_attach_worker, initargs=(self._shared.spec,))
+        return self._pool
+
+    def hit_test(self, points):
+        """
+        Returns for every point the index of the topmost shape containing it.
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (n, 2) array of point coordinates.
+
+        Returns
+        -------
+        np.ndarray
+            (n,) indices into the list of shapes, -1 for points outside of every shape. Shapes later in the
+            list are drawn on top, so the largest index wins.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not self._use_pool(len(points)):
+            return _hit_test(self.scene, points)
+        pool = self._get_pool()
+        with SharedArrays({"points": points}) as shared_points:
+            edges = np.linspace(0, len(points), self.processes * 4 + 1).astype(np.int64)
+            tasks = [(shared_points.spec, start, end) for start, end in zip(edges[:-1], edges[1:]) if end > start]
+            results = pool.starmap(_hit_test_task, tasks)
+        return np.concatenate(results)
+
+    def overlapping_pairs(self):
+        """
+        Returns all pairs of overlapping shapes.
+
+        The work is sharded spatially: every worker handles a range of grid cells with about the same number of
+        candidate pairs.
+
+        Returns
+        -------
+        np.ndarray
+            (n, 2) array of sorted (i, j) pairs of indices into the list of shapes with i < j. Shapes of one group
+            are never reported against each other.
+        """
+        if not self._use_pool(len(self.scene.kinds)):
+            return _overlapping_pairs(self.scene, 0, len(self.scene.cell_offsets) - 1)
+        pool = self._get_pool()
+        # balance the shards by the number of candidate pairs per cell
+        items_per_cell = np.diff(self.scene.cell_offsets)
+        work = np.cumsum(items_per_cell * (items_per_cell - 1) // 2 + 1)
+        targets = np.linspace(0, work[-1], self.processes * 4 + 1)[1:-1]
+        edges = np.concatenate([[0], np.searchsorted(work, targets), [len(work)]])
+        tasks = [(start, end) for start, end in zip(edges[:-1], edges[1:]) if end > start]
+        return _merge_pairs(pool.starmap(_overlapping_pairs_task, tasks))
+
+    def close(self):
+        """
+        Stops the pool and releases the shared memory.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def _build_grid(bounds):
+    """
+    Builds a uniform grid over the bounds with about one shape per cell.
+
+    Returns
+    -------
+    tuple
+        (grid, cell_offsets, cell_items), see PackedScene.
+    """
+    count = len(bounds)
+    if count == 0:
+        return np.array([0.0, 0.0, 1.0, 1.0, 1, 1]), np.zeros(2, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    x0, y0 = bounds[:, :2].min(axis=0)
+    x1, y1 = bounds[:, 2:].max(axis=0)
+    cells = int(np.clip(np.ceil(np.sqrt(count)), 1, MAX_GRID_CELLS_PER_AXIS))
+    cell_width = max((x1 - x0) / cells, 1.0)
+    cell_height = max((y1 - y0) / cells, 1.0)
+    grid = np.array([x0, y0, cell_width, cell_height, cells, cells])
+    cx0, cy0 = _cell_coordinates(grid, bounds[:, 0], bounds[:, 1])
+    cx1, cy1 = _cell_coordinates(grid, bounds[:, 2], bounds[:, 3])
+    widths = cx1 - cx0 + 1
+    shape_index, local = _expand(np.zeros(count, dtype=np.int64), widths * (cy1 - cy0 + 1))
+    local_width = widths[shape_index]
+    cell = (cy0[shape_index] + local // local_width) * cells + cx0[shape_index] + local % local_width
+    order = np.argsort(cell, kind="stable")
+    cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(cell, minlength=cells * cells))]).astype(np.int64)
+    return grid, cell_offsets, shape_index[order]
+
+def _cell_coordinates(grid, x, y):
+    """
+    Returns the cell column and row of coordinates, clipped to the grid.
+    """
+    x0, y0, cell_width, cell_height, cells_x, cells_y = grid
+    column = np.clip(np.floor((x - x0) / cell_width), 0, cells_x - 1).astype(np.int64)
+    row = np.clip(np.floor((y - y0) / cell_height), 0, cells_y - 1).astype(np.int64)
+    return column, row
+
+def _expand(starts, counts):
+    """
+    Expands ranges into flat indices.
+
+    Returns
+    -------
+    tuple
+        (range index, position) where range index repeats i counts[i] times and position runs from
+        starts[i] to starts[i] + counts[i] - 1 for each i.
+    """
+    range_index = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    return range_index, starts[range_index] + np.arange(counts.sum()) - first[range_index]
+
+def _hit_test(scene, points):
+    """
+    Returns the topmost shape containing each point, see SceneQueries.hit_test.
+    """
+    result = np.full(len(points), -1, dtype=np.int64)
+    for start in range(0, len(points), CHUNK_SIZE):
+        result[start:start + CHUNK_SIZE] = _hit_test_chunk(scene, points[start:start + CHUNK_SIZE])
+    return result
+
+def _hit_test_chunk(scene, points):
+    """
+    Returns the topmost shape containing each point of one chunk.
+    """
+    result = np.full(len(points), -1, dtype=np.int64)
+    x0, y0, cell_width, cell_height, cells_x, cells_y = scene.grid
+    # the bounds of the scene are inclusive, _cell_coordinates puts points on the far edges in the last cells
+    inside_grid = (points[:, 0] >= x0) & (points[:, 0] <= x0 + cell_width * cells_x) & (points[:, 1] >= y0) & (points[:, 1] <= y0 + cell_height * cells_y)
+    point_index = np.flatnonzero(inside_grid)
+    column, row = _cell_coordinates(scene.grid, points[point_index, 0], points[point_index, 1])
+    cell = row * int(cells_x) + column
+    cell_start = scene.cell_offsets[cell]
+    pair, position = _expand(cell_start, scene.cell_offsets[cell + 1] - cell_start)
+    pair_point = point_index[pair]
+    pair_shape = scene.cell_items[position]
+    px = points[pair_point, 0]
+    py = points[pair_point, 1]
+    bounds = scene.bounds[pair_shape]
+    keep = (px >= bounds[:, 0]) & (px <= bounds[:, 2]) & (py >= bounds[:, 1]) & (py <= bounds[:, 3])
+    pair_point, pair_shape, px, py = pair_point[keep], pair_shape[keep], px[keep], py[keep]
+
+    hit = np.zeros(len(pair_shape), dtype=bool)
+    is_circle = scene.kinds[pair_shape] == CIRCLE
+    hit[is_circle] = _outline_contains(scene.circles[pair_shape[is_circle]], px[is_circle], py[is_circle])
+
+    polygon_pairs = np.flatnonzero(~is_circle)
+    hit[polygon_pairs] = _packed_contains(scene, np.stack([px[polygon_pairs], py[polygon_pairs]], axis=1), pair_shape[polygon_pairs])
+
+    np.maximum.at(result, pair_point[hit], scene.owners[pair_shape[hit]])
+    return result
+
+def _outline_contains(circles, px, py):
+    """
+    Returns elementwise whether the points (px, py) are inside the polygon of Circle.get_points() of the circles
+    (x, y, radius) or on its outline, like Circle.contains.
+
+    The polygon is the regular polygon with CIRCLE_OUTLINE_POINTS - 1 edges with its vertices rounded towards zero,
+    by less than one pixel towards smaller coordinates where they are positive, so only the points in a band about
+    1.5 pixels wide around the circle (3 pixels where it crosses an axis) are tested against the polygon itself.
+    """
+    positive = np.min(circles[:, :2], axis=1) >= circles[:, 2]
+    shift = np.where(positive, 0.5, 0.0)
+    margin = np.where(positive, 0.75, 1.5)
+    distance = np.sqrt((px - circles[:, 0] + shift) ** 2 + (py - circles[:, 1] + shift) ** 2)
+    radius = circles[:, 2]
+    result = distance < radius * np.cos(np.pi / (CIRCLE_OUTLINE_POINTS - 1)) - margin
+    near = np.flatnonzero(~result & (distance <= radius + margin))
+    outlines = _circle_outlines(circles[near])
+    # NOTE: one cv2 call per point is faster here than testing the points against all edges at once
+    result[near] = [cv2.pointPolygonTest(outline, (x, y), False) >= 0 for outline, x, y in zip(outlines, px[near].tolist(), py[near].tolist())]
+    return result
+
+def _overlapping_pairs(scene, cell_start, cell_end):
+    """
+    Returns the overlapping pairs whose first common cell is in [cell_start, cell_end), see SceneQueries.overlapping_pairs.
+    """
+    # walk the cells in steps of about NARROW_PHASE_ROWS candidate pairs
+    items_per_cell = np.diff(scene.cell_offsets[cell_start:cell_end + 1])
+    candidates = np.cumsum(items_per_cell * (items_per_cell - 1) // 2)
+    steps = np.searchsorted(candidates, np.arange(NARROW_PHASE_ROWS, candidates[-1] if len(candidates) else 0, NARROW_PHASE_ROWS))
+    edges = np.unique(np.concatenate([[0], steps, [len(items_per_cell)]])) + cell_start
+    pairs = [_overlapping_pairs_step(scene, start, end) for start, end in zip(edges[:-1], edges[1:])]
+    return _merge_pairs(pairs)
+
+def _overlapping_pairs_step(scene, cell_start, cell_end):
+    """
+    Returns the overlapping pairs whose first common cell is in [cell_start, cell_end), as an unsorted (n, 2) array.
+    """
+    # every item of a cell is paired with the items after it in the same cell
+    item_start = scene.cell_offsets[cell_start]
+    item_cells = np.repeat(np.arange(cell_start, cell_end), np.diff(scene.cell_offsets[cell_start:cell_end + 1]))
+    item_positions = np.arange(item_start, item_start + len(item_cells))
+    item_index, position = _expand(item_positions + 1, scene.cell_offsets[item_cells + 1] - item_positions - 1)
+    first = scene.cell_items[item_positions[item_index]]
+    second = scene.cell_items[position]
+    cell = item_cells[item_index]
+    bounds1 = scene.bounds[first]
+    bounds2 = scene.bounds[second]
+    keep = ((bounds1[:, 0] <= bounds2[:, 2]) & (bounds2[:, 0] <= bounds1[:, 2]) & (bounds1[:, 1] <= bounds2[:, 3]) & (bounds2[:, 1] <= bounds1[:, 3])
+            & (scene.owners[first] != scene.owners[second]))
+    # a pair shares several cells when both span them, only the cell of the corner of the overlap reports it
+    column, row = _cell_coordinates(scene.grid, np.maximum(bounds1[:, 0], bounds2[:, 0]), np.maximum(bounds1[:, 1], bounds2[:, 1]))
+    keep &= row * int(scene.grid[4]) + column == cell
+    first, second = first[keep], second[keep]
+    overlap = _overlap_mask(scene, first, second)
+    owners1 = scene.owners[first[overlap]]
+    owners2 = scene.owners[second[overlap]]
+    return np.stack([np.minimum(owners1, owners2), np.maximum(owners1, owners2)], axis=1)
+
+def _merge_pairs(pairs):
+    """
+    Merges (n, 2) arrays of pairs into one sorted array without duplicates.
+
+    Shapes of groups can make several packed pairs for one pair of shapes, in different cells or shards.
+    """
+    pairs = [p for p in pairs if len(p)]
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate(pairs)
+    # unique on one int64 key is much faster than on rows
+    stride = int(pairs.max()) + 1
+    keys = np.unique(pairs[:, 0] * stride + pairs[:, 1])
+    return np.stack([keys // stride, keys % stride], axis=1)
+
+def _packed_edges(scene, shapes):
+    """
+    Returns the edges of packed polygons.
+
+    Returns
+    -------
+    tuple
+        (index into shapes, start points, end points) with one row per edge.
+    """
+    vertex_start = scene.offsets[shapes]
+    vertex_count = scene.offsets[shapes + 1] - vertex_start
+    owner, a_index = _expand(vertex_start, vertex_count)
+    b_index = a_index + 1
+    last = b_index == (vertex_start + vertex_count)[owner]
+    b_index[last] = vertex_start[owner[last]]
+    return owner, scene.vertices[a_index], scene.vertices[b_index]
+
+def _packed_contains(scene, points, shapes):
+    """
+    Returns elementwise whether points[i] is inside the packed polygon shapes[i] or on its outline, using the
+    crossing number.
+    """
+    owner, a, b = _packed_edges(scene, shapes)
+    crossings = np.bincount(owner, weights=_ray_crossings(points[owner, 0], points[owner, 1], a, b), minlength=len(shapes))
+    on_edge = np.bincount(owner, weights=_segment_distances(points[owner], a, b) <= EDGE_TOLERANCE, minlength=len(shapes))
+    return (crossings % 2 == 1) | (on_edge > 0)
+
+def _separated(scene, first, second):
+    """
+    Returns elementwise whether the convex packed polygons first[i] and second[i] have a separating axis, i.e.
+    whether they are apart or only touch, by projecting both on the normals of all their edges.
+    """
+    if not len(first):
+        return np.zeros(0, dtype=bool)
+    count1 = scene.offsets[first + 1] - scene.offsets[first]
+    count2 = scene.offsets[second + 1] - scene.offsets[second]
+    # one axis per edge of both polygons, the edges of the first polygon first
+    pair, axis = _expand(np.zeros(len(first), dtype=np.int64), count1 + count2)
+    of_first = axis < count1[pair]
+    polygon = np.where(of_first, first[pair], second[pair])
+    start = scene.offsets[polygon]
+    count = scene.offsets[polygon + 1] - start
+    edge = np.where(of_first, axis, axis - count1[pair])
+    direction = scene.vertices[start + (edge + 1) % count] - scene.vertices[start + edge]
+    length = np.sqrt(np.sum(direction ** 2, axis=1))
+    normal = np.stack([-direction[:, 1], direction[:, 0]], axis=1) / np.maximum(length, EDGE_TOLERANCE)[:, None]
+    # every axis projects the vertices of the first polygon and then those of the second
+    axis_index, vertex = _expand(np.zeros(len(pair), dtype=np.int64), (count1 + count2)[pair])
+    vertex_pair = pair[axis_index]
+    vertex_of_first = vertex < count1[vertex_pair]
+    vertex_index = np.where(vertex_of_first, scene.offsets[first[vertex_pair]] + vertex, scene.offsets[second[vertex_pair]] + vertex - count1[vertex_pair])
+    projection = np.sum(scene.vertices[vertex_index] * normal[axis_index], axis=1)
+    axis_start = np.cumsum((count1 + count2)[pair]) - (count1 + count2)[pair]
+    bounds = np.stack([axis_start, axis_start + count1[pair]], axis=1).ravel()
+    low = np.minimum.reduceat(projection, bounds).reshape(-1, 2)
+    high = np.maximum.reduceat(projection, bounds).reshape(-1, 2)
+    # edges of length zero have no normal and separate nothing
+    separating = ((high[:, 0] <= low[:, 1] + EDGE_TOLERANCE) | (high[:, 1] <= low[:, 0] + EDGE_TOLERANCE)) & (length > EDGE_TOLERANCE)
+    return np.bincount(pair, weights=separating, minlength=len(first)) > 0
+
+def _overlap_mask(scene, first, second):
+    """
+    Returns elementwise whether the packed shapes first[i] and second[i] overlap.
+
+    The pairs are tested in chunks of about NARROW_PHASE_ROWS rows, where a polygon pair costs one row per edge
+    and vertex of both polygons.
+    """
+    # circles second, so there are only circle-circle, polygon-circle and polygon-polygon pairs
+    swap = scene.kinds[first] == CIRCLE
+    first, second = np.where(swap, second, first), np.where(swap, first, second)
+    vertex_count = np.diff(scene.offsets)
+    cost = (vertex_count[first] + vertex_count[second]) ** 2 + 1
+    ends = np.searchsorted(np.cumsum(cost), np.arange(NARROW_PHASE_ROWS, cost.sum(), NARROW_PHASE_ROWS))
+    edges = np.unique(np.concatenate([[0], ends, [len(first)]]))
+    result = np.zeros(len(first), dtype=bool)
+    for start, end in zip(edges[:-1], edges[1:]):
+        result[start:end] = _overlap_mask_chunk(scene, first[start:end], second[start:end])
+    return result
+
+def _overlap_mask_chunk(scene, first, second):
+    """
+    Returns elementwise whether the packed shapes first[i] and second[i] overlap, second is a circle whenever first is.
+    """
+    result = np.zeros(len(first), dtype=bool)
+    first_is_circle = scene.kinds[first] == CIRCLE
+    second_is_circle = scene.kinds[second] == CIRCLE
+
+    both = np.flatnonzero(first_is_circle)
+    circles1 = scene.circles[first[both]]
+    circles2 = scene.circles[second[both]]
+    result[both] = np.sum((circles1[:, :2] - circles2[:, :2]) ** 2, axis=1) < (circles1[:, 2] + circles2[:, 2]) ** 2
+
+    # a circle overlaps a polygon if its center is inside or closer to an edge than the radius
+    mixed = np.flatnonzero(~first_is_circle & second_is_circle)
+    polygons = first[mixed]
+    circles = scene.circles[second[mixed]]
+    owner, a, b = _packed_edges(scene, polygons)
+    distance = np.full(len(mixed), np.inf)
+    np.minimum.at(distance, owner, _segment_distances(circles[owner, :2], a, b))
+    crossings = np.bincount(owner, weights=_ray_crossings(circles[owner, 0], circles[owner, 1], a, b), minlength=len(mixed))
+    result[mixed] = (crossings % 2 == 1) | (distance < circles[:, 2] - EDGE_TOLERANCE)
+
+    # two convex polygons overlap if no axis separates them
+    pairs = np.flatnonzero(~first_is_circle & ~second_is_circle)
+    result[pairs] = ~_separated(scene, first[pairs], second[pairs])
+    return result
+
+def _attach_worker(spec):
+    """
+    Pool initializer, attaches the worker to the shared scene once.
+    """
+    arrays, blocks = SharedArrays.attach(spec)
+    _worker_state["scene"] = PackedScene(**arrays)
+    _worker_state["blocks"] = blocks
+
+def _hit_test_task(points_spec, start, end):
+    """
+    Worker task, hit test for the points [start, end) of the shared points.
+    """
+    arrays, blocks = SharedArrays.attach(points_spec)
+    try:
+        return _hit_test(_worker_state["scene"], arrays["points"][start:end])
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+def _overlapping_pairs_task(cell_start, cell_end):
+    """
+    Worker task, overlapping pairs for the cells [cell_start, cell_end).
+    """
+    return _overlapping_pairs(_worker_state["scene"], cell_start, cell_end)
@@ -1,7 +1,319 @@
+import copy
+import itertools
+
 import cv2
 import numpy as np
 from frame import Frame
 
+IDENTITY = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+EMPTY_BOUNDS = (np.inf, np.inf, -np.inf, -np.inf)
+# points closer than this to an edge are on the outline of a polygon
+EDGE_TOLERANCE = 1e-9
+# the number of points of the polygon that approximates a circle, the first and the last are the same
+CIRCLE_OUTLINE_POINTS = 100
+
+def translation_matrix(dx, dy):
+    """
+    Returns the 2x3 affine matrix that moves by dx and dy.
+    """
+    return np.array([[1.0, 0.0, dx], [0.0, 1.0, dy]])
+
+def rotation_matrix(degrees, origin=(0, 0)):
+    """
+    Returns the 2x3 affine matrix that rotates by degrees around origin.
+
+    The direction matches Rectangle.rotation_degrees, i.e. rotating a rectangle by 30 degrees
+    adds 30 to its rotation_degrees. NOTE: This is the opposite direction of cv2.getRotationMatrix2D.
+    """
+    radians = np.radians(degrees)
+    cos, sin = np.cos(radians), np.sin(radians)
+    ox, oy = origin
+    return np.array([[cos, -sin, ox - cos * ox + sin * oy], [sin, cos, oy - sin * ox - cos * oy]])
+
+def scaling_matrix(factor, origin=(0, 0)):
+    """
+    Returns the 2x3 affine matrix that scales by factor around origin.
+    """
+    ox, oy = origin
+    return np.array([[factor, 0.0, ox - factor * ox], [0.0, factor, oy - factor * oy]])
+
+def _apply_affine(points, matrix):
+    """
+    Applies a 2x3 affine matrix to an (..., 2) array of points.
+    """
+    return points @ matrix[:, :2].T + matrix[:, 2]
+
+def _compose(outer, inner):
+    """
+    Returns the 2x3 affine matrix that applies inner and then outer.
+    """
+    return np.hstack([outer[:, :2] @ inner[:, :2], (outer[:, :2] @ inner[:, 2] + outer[:, 2])[:, None]])
+
+def _invert(matrix):
+    """
+    Returns the inverse of a 2x3 affine matrix.
+    """
+    (a, b, tx), (c, d, ty) = matrix.tolist()
+    det = a * d - b * c
+    return np.array([[d / det, -b / det, (b * ty - d * tx) / det], [-c / det, a / det, (c * tx - a * ty) / det]])
+
+def _is_similarity(matrix):
+    """
+    Returns True if a 2x3 affine matrix only rotates, mirrors, scales uniformly by a nonzero factor and
+    translates, i.e. maps circles to circles and can be inverted.
+    """
+    (a, b), (c, d) = matrix[:, :2].tolist()
+    if a == 0 and b == 0:
+        return False
+    tolerance = 1e-9 * (abs(a) + abs(b))
+    return abs(a - d) <= tolerance and abs(b + c) <= tolerance or abs(a + d) <= tolerance and abs(b - c) <= tolerance
+
+def _transform_bounds(bounds, matrix):
+    """
+    Returns the axis aligned bounds of the bounds (xmin, ymin, xmax, ymax) mapped through a 2x3 affine matrix.
+    """
+    if bounds == EMPTY_BOUNDS:
+        return bounds
+    xmin, ymin, xmax, ymax = bounds
+    corners = _apply_affine(np.array([[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax]], dtype=np.float64), matrix)
+    return (*corners.min(axis=0).tolist(), *corners.max(axis=0).tolist())
+
+def _circle_outlines(circles):
+    """
+    Returns the (n, CIRCLE_OUTLINE_POINTS, 2) int32 polygons that approximate circles given as (x, y, radius), see
+    Circle.get_points.
+    """
+    circles = np.asarray(circles, dtype=np.float64).reshape(-1, 3)
+    angles = np.linspace(0, 2 * np.pi, CIRCLE_OUTLINE_POINTS)
+    x = circles[:, 0, None] + circles[:, 2, None] * np.cos(angles)
+    y = circles[:, 1, None] + circles[:, 2, None] * np.sin(angles)
+    return np.stack([x, y], axis=-1).astype(np.int32)
+
+def _bounds_overlap(bounds1, bounds2):
+    """
+    Returns True if two bounds (xmin, ymin, xmax, ymax) touch or overlap.
+    """
+    return bounds1[0] <= bounds2[2] and bounds2[0] <= bounds1[2] and bounds1[1] <= bounds2[3] and bounds2[1] <= bounds1[3]
+
+def _cross(a, b):
+    """
+    Returns the z component of the cross product of two (..., 2) arrays.
+    """
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+def _edges(polygon):
+    """
+    Returns the start and end points of the edges of an (n, 2) polygon.
+    """
+    return polygon, np.roll(polygon, -1, axis=0)
+
+def _segments_touch(a1, b1, a2, b2):
+    """
+    Returns elementwise whether the segments a1-b1 touch the segments a2-b2. The (..., 2) arguments broadcast.
+    """
+    d1 = b1 - a1
+    d2 = b2 - a2
+    denom = _cross(d1, d2)
+    diff = a2 - a1
+    side = _cross(diff, d1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = _cross(diff, d2) / denom
+        u = side / denom
+    touch = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    # collinear segments touch if their projections on the line overlap
+    length = np.maximum(np.sum(d1 * d1, axis=-1), 1e-12)
+    s0 = np.sum(diff * d1, axis=-1) / length
+    s1 = np.sum((b2 - a1) * d1, axis=-1) / length
+    collinear = (denom == 0) & (side == 0) & (np.maximum(np.minimum(s0, s1), 0) <= np.minimum(np.maximum(s0, s1), 1))
+    return touch | collinear
+
+def _segments_intersect(a1, b1, a2, b2):
+    """
+    Returns True if any of the segments a1[i]-b1[i] touches any of the segments a2[j]-b2[j].
+    """
+    return bool(np.any(_segments_touch(a1[:, None], b1[:, None], a2[None], b2[None])))
+
+def _ray_crossings(px, py, a, b):
+    """
+    Returns elementwise whether the edges a-b cross the ray from (px, py) towards +x. The arguments broadcast.
+
+    A point is inside a polygon if the ray crosses an odd number of its edges.
+    """
+    crosses = (a[..., 1] > py) != (b[..., 1] > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_intersect = a[..., 0] + (py - a[..., 1]) * (b[..., 0] - a[..., 0]) / (b[..., 1] - a[..., 1])
+    return crosses & (px < x_intersect)
+
+def _points_in_polygon(points, polygon):
+    """
+    Returns a bool array telling which of the (n, 2) points are inside the polygon, using the crossing number.
+    """
+    a, b = _edges(polygon)
+    return np.count_nonzero(_ray_crossings(points[:, 0, None], points[:, 1, None], a, b), axis=1) % 2 == 1
+
+def _segment_distances(points, a, b):
+    """
+    Returns elementwise the distance of the points to the segments a-b. The (..., 2) arguments broadcast.
+    """
+    d = b - a
+    length = np.maximum(np.sum(d * d, axis=-1), 1e-12)
+    u = np.clip(np.sum((points - a) * d, axis=-1) / length, 0, 1)
+    closest = a + u[..., None] * d
+    return np.sqrt(np.sum((closest - points) ** 2, axis=-1))
+
+def _point_segments_distance(point, a, b):
+    """
+    Returns the distance of a point to the closest of the segments a[i]-b[i].
+    """
+    return float(np.min(_segment_distances(point, a, b)))
+
+def _polygons_overlap(polygon1, polygon2):
+    """
+    Returns True if two polygons (convex or not) touch or overlap.
+    """
+    if _segments_intersect(*_edges(polygon1), *_edges(polygon2)):
+        return True
+    # no crossing edges, so they only overlap if one is inside the other
+    return bool(_points_in_polygon(polygon1[:1], polygon2)[0] or _points_in_polygon(polygon2[:1], polygon1)[0])
+
+def _circle_polygon_overlap(center, radius, polygon):
+    """
+    Returns True if a circle touches or overlaps a polygon.
+    """
+    if _points_in_polygon(center[None], polygon)[0]:
+        return True
+    return _point_segments_distance(center, *_edges(polygon)) <= radius
+
+def _ray_segments_toi(origins, direction, a, b):
+    """
+    Returns the smallest t in [0, 1] at which any of the points origins + t * direction hits any of the
+    segments a[j]-b[j], or inf.
+    """
+    e = b - a
+    denom = _cross(direction, e)
+    diff = a[None] - origins[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = _cross(diff, e[None]) / denom
+        u = _cross(diff, direction) / denom
+    t = np.where((denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1), t, np.inf)
+    return float(t.min(initial=np.inf))
+
+def _ray_circles_toi(origin, direction, centers, radii):
+    """
+    Returns the smallest t in [0, 1] at which origin + t * direction enters any of the circles, or inf.
+    """
+    a = np.dot(direction, direction)
+    if a == 0:
+        return np.inf
+    offset = origin - centers
+    b = 2 * offset @ direction
+    c = np.sum(offset * offset, axis=1) - radii ** 2
+    disc = b ** 2 - 4 * a * c
+    t = (-b - np.sqrt(np.maximum(disc, 0))) / (2 * a)
+    t = np.where((disc >= 0) & (t >= 0) & (t <= 1), t, np.inf)
+    return float(t.min(initial=np.inf))
+
+def _circle_polygon_toi(center, radius, direction, polygon):
+    """
+    Returns the time of impact of a circle moving by direction against a static polygon, or inf.
+    """
+    if _circle_polygon_overlap(center, radius, polygon):
+        return 0.0
+    a, b = _edges(polygon)
+    # the circle first touches either an edge, i.e. hits the edge moved out by the radius on one of its
+    # sides, or a vertex, i.e. its center enters the circle of the same radius around the vertex
+    e = b - a
+    normals = np.stack([-e[:, 1], e[:, 0]], axis=1) / np.maximum(np.linalg.norm(e, axis=1), 1e-12)[:, None] * radius
+    origin = center[None]
+    t_edges = min(_ray_segments_toi(origin, direction, a + normals, b + normals), _ray_segments_toi(origin, direction, a - normals, b - normals))
+    t_vertices = _ray_circles_toi(center, direction, polygon, np.full(len(polygon), float(radius)))
+    return min(t_edges, t_vertices)
+
+def _triangulate(vertices):
+    """
+    Triangulates a simple polygon (convex or not) by ear clipping.
+
+    Returns
+    -------
+    np.ndarray
+        (n - 2, 3) array of vertex indices, every triangle with the same orientation.
+    """
+    remaining = list(range(len(vertices)))
+    if np.sum(_cross(vertices, np.roll(vertices, -1, axis=0))) < 0:
+        remaining.reverse()
+    triangles = []
+    while len(remaining) > 3:
+        points = vertices[remaining]
+        previous = np.roll(points, 1, axis=0)
+        following = np.roll(points, -1, axis=0)
+        convex = _cross(points - previous, following - points) >= 0
+        reflex = points[~convex]
+        ear = 0
+        for i in np.flatnonzero(convex):
+            a, b, c = previous[i], points[i], following[i]
+            inside = (_cross(b - a, reflex - a) > 0) & (_cross(c - b, reflex - b) > 0) & (_cross(a - c, reflex - c) > 0)
+            if not np.any(inside):
+                ear = i
+                break
+        # if no ear is found the polygon is self intersecting, clipping any vertex still terminates
+        triangles.append((remaining[ear - 1], remaining[ear], remaining[(ear + 1) % len(remaining)]))
+        del remaining[ear]
+    triangles.append(tuple(remaining))
+    return np.array(triangles, dtype=np.int64)
+
+def _sweep_geometry(shape):
+    """
+    Returns the geometry of a shape for swept tests, (center, radius) for circles and (vertices, None) otherwise.
+    """
+    if isinstance(shape, Circle):
+        return np.array([shape.center.x, shape.center.y], dtype=np.float64), float(shape.radius)
+    return np.asarray(shape.get_points(), dtype=np.float64).reshape(-1, 2), None
+
+def _sweep_toi(moving, direction, static):
+    """
+    Returns the time of impact of a shape moving by direction against a static shape, or inf.
+
+    Both shapes are given as returned by _sweep_geometry, the moving one at t = 0.
+    """
+    (moving_points, moving_radius), (static_points, static_radius) = moving, static
+    if moving_radius is not None and static_radius is not None:
+        radius = moving_radius + static_radius
+        if np.sum((moving_points - static_points) ** 2) <= radius ** 2:
+            return 0.0
+        return _ray_circles_toi(moving_points, direction, static_points[None], np.array([radius]))
+    if moving_radius is not None:
+        return _circle_polygon_toi(moving_points, moving_radius, direction, static_points)
+    if static_radius is not None:
+        # the polygon moving towards the circle is the circle moving away from the polygon
+        return _circle_polygon_toi(static_points, static_radius, -direction, moving_points)
+    if _polygons_overlap(moving_points, static_points):
+        return 0.0
+    return min(_ray_segments_toi(moving_points, direction, *_edges(static_points)), _ray_segments_toi(static_points, -direction, *_edges(moving_points)))
+
+def _exact(rounded, exact):
+    """
+    Returns the float geometry that transforms stored in exact where it still rounds to the rounded geometry of the
+    shapes, otherwise the shape was changed since and the rounded geometry is used as floats.
+
+    Shapes keep integer Points, transforms keep the float geometry next to them so that repeated transforms
+    do not add up rounding errors. rounded holds one list per coordinate with the values of all shapes, and exact
+    the tuple of coordinates stored by the last transform of every shape, None for shapes that were never
+    transformed, so all shapes are checked in one vectorized comparison.
+
+    NOTE: the geometry is passed by coordinate and stored in tuples that replace the old ones, as creating one
+    container per shape at once triggers full garbage collections that scan every shape of the frame.
+    """
+    # NOTE: np.fromiter is much faster than np.array for long lists
+    rounded = np.array([np.fromiter(column, dtype=np.float64, count=len(column)) for column in rounded]).T
+    missing = exact.count(None)
+    if missing == len(exact):
+        return rounded
+    if missing:
+        exact = [row if stored is None else stored for row, stored in zip(rounded, exact)]
+    exact = np.fromiter(itertools.chain.from_iterable(exact), dtype=np.float64, count=rounded.size).reshape(rounded.shape)
+    return np.where(np.rint(exact) == rounded, exact, rounded)
+
+
 class Point():
     """
     A class to represent a point in 2D space.
@@ -46,23 +358,44 @@ class Shape():
         The colour of the shape. In BGR format.(opencv uses BGR format)
     frame : Frame
         The frame to draw the shape on.
+    parent : Group
+        The group the shape belongs to, None if the shape is directly in the frame.
     Methods
     -------
     set_colour(colour):
         Sets the colour of the shape.
     move(dx, dy):
         Moves the shape by dx and dy.
+    rotate(degrees, origin=None):
+        Rotates the shape around origin, by default around its center.
+    scale(factor, origin=None):
+        Scales the shape around origin, by default around its center.
+    transform(matrix):
+        Applies a 2x3 affine matrix to the shape.
+    transform_many(shapes, matrix):
+        Applies a 2x3 affine matrix to many shapes of this class at once.
     get_points():
         Returns the points of the shape. This method should be overridden by subclasses.
+    get_bounds():
+        Returns the axis aligned bounding box of the shape.
+    sprite_key():
+        Returns the key of the shape in a SpriteCache, None if it can not be cached.
     contains(point):
         Returns True if the point is contained within the shape. This can be overridden by subclasses.
     overlaps(other_shape):
         Returns True if the shape overlaps with another shape. This can be overridden by subclasses.
+    time_of_impact(previous, others=None):
+        Returns the earliest time the shape hits another shape while moving from its previous pose.
+    snapshot():
+        Returns a detached copy of the shape for rendering on another thread.
 
 
 
     
     """
+    # the float center stored by the last transform, see _exact
+    _exact_center = None
+
     def __init__(self, points,frame, colour=(255, 255, 255)):
         """
         Initializes the shape with a center and colour."""
@@ -70,6 +403,7 @@ class Shape():
         self.center = points
         self.colour = colour
         self.frame = frame
+        self.parent = None
         self.add_to_frame()
 
     # def __del__(self):
@@ -85,7 +419,10 @@ class Shape():
 
         NOTE: This method exists because the __del__ method is not called when the object is deleted from a list for some wierd reason.
         """
-        self.frame.remove_shape(self)
+        if self.parent is not None:
+            self.parent.remove(self)
+        else:
+            self.frame.remove_shape(self)
         del self
 
 
@@ -106,6 +443,100 @@ class Shape():
         """
         self.colour = colour
 
+    def snapshot(self):
+        """
+        Returns a copy of the shape that is not affected by later updates of the shape.
+
+        The copy still references the same frame but is not added to it. Subclasses that hold
+        more Points than the center should override this and copy them as well.
+
+        Returns
+        -------
+        Shape
+            The detached copy.
+        """
+        snap = copy.copy(self)
+        snap.center = Point(self.center.x, self.center.y)
+        snap.parent = None
+        return snap
+
+    def _changed(self):
+        """
+        Tells the parent group that the geometry of the shape changed, so its cached bounds are stale.
+        Every method that changes the geometry of a shape must call this.
+        """
+        if self.parent is not None:
+            self.parent._child_changed()
+
+    def move(self, dx, dy):
+        """
+        Moves the shape by dx and dy.
+        """
+        self.transform(translation_matrix(dx, dy))
+
+    def rotate(self, degrees, origin=None):
+        """
+        Rotates the shape by degrees around origin.
+
+        Parameters
+        ----------
+        degrees : float
+            The rotation in degrees, in the same direction as Rectangle.rotation_degrees.
+        origin : Point, optional
+            The point to rotate around. Defaults to the center of the shape.
+        """
+        origin = self.center if origin is None else origin
+        self.transform(rotation_matrix(degrees, (origin.x, origin.y)))
+
+    def scale(self, factor, origin=None):
+        """
+        Scales the shape by factor around origin.
+
+        Parameters
+        ----------
+        factor : float
+            The scale factor.
+        origin : Point, optional
+            The point to scale around. Defaults to the center of the shape.
+        """
+        origin = self.center if origin is None else origin
+        self.transform(scaling_matrix(factor, (origin.x, origin.y)))
+
+    def transform(self, matrix):
+        """
+        Applies a 2x3 affine matrix to the shape.
+
+        Parameters
+        ----------
+        matrix : np.ndarray
+            The 2x3 affine matrix, e.g. from rotation_matrix().
+        """
+        type(self).transform_many([self], matrix)
+
+    @classmethod
+    def transform_many(cls, shapes, matrix):
+        """
+        Applies a 2x3 affine matrix to many shapes of this class in one vectorized pass.
+
+        The base class only moves the centers. Subclasses with more geometry should extend this. The float
+        geometry is kept next to the integer Points (see _exact), so repeated small transforms do not drift.
+
+        Parameters
+        ----------
+        shapes : list
+            The shapes to transform. All must be instances of cls.
+        matrix : np.ndarray
+            The 2x3 affine matrix.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        centers = _exact([[shape.center.x for shape in shapes], [shape.center.y for shape in shapes]],
+                         [shape._exact_center for shape in shapes])
+        centers = _apply_affine(centers, matrix)
+        for shape, x, y, exact_x, exact_y in zip(shapes, *np.rint(centers).astype(np.int64).T.tolist(), *centers.T.tolist()):
+            shape.center = Point(x, y)
+            shape._exact_center = (exact_x, exact_y)
+            shape._changed()
+
 
     def get_points(self):
         """
@@ -113,6 +544,35 @@ class Shape():
         """
         raise NotImplementedError("This method cannot be called from the base class")
 
+    def get_bounds(self):
+        """
+        Returns the axis aligned bounding box of the shape.
+
+        The bounds are in the coordinates the shape is defined in, i.e. frame coordinates unless the shape
+        belongs to a group, in which case they are in the local coordinates of the group.
+
+        Returns
+        -------
+        tuple
+            (xmin, ymin, xmax, ymax)
+        """
+        points = np.asarray(self.get_points()).reshape(-1, 2)
+        return (*points.min(axis=0).tolist(), *points.max(axis=0).tolist())
+
+    def sprite_key(self):
+        """
+        Returns the key of the shape in a SpriteCache, None if it can not be cached. This can be overridden by subclasses.
+
+        Shapes that return a key must also implement draw_sprite(frame, center, rotation_degrees, colour).
+
+        Returns
+        -------
+        tuple or None
+            (key, rotation_degrees) where key is hashable and identifies everything but the position, rotation
+            and colour of the shape.
+        """
+        return None
+
     def contains(self, point):
         """
         Returns True if the point is contained within the shape. This can be overridden by subclasses.
@@ -150,6 +610,8 @@ class Shape():
             True if the shape overlaps with the other shape.
 
         """
+        if isinstance(other_shape, (Group, Polygon)):
+            return other_shape.overlaps(self)
         points1 = self.get_points()
         points2 = other_shape.get_points()
         points1 = np.array(points1, dtype=np.float32)
@@ -157,6 +619,62 @@ class Shape():
         intersection, _ = cv2.intersectConvexConvex(points1, points2)
         return intersection > 0
 
+    def time_of_impact(self, previous, others=None):
+        """
+        Returns the earliest time at which the shape hits another shape while moving from its previous pose
+        to its current pose, so fast moving shapes can not tunnel through thin shapes between two updates.
+
+        The motion is treated as a translation of the current outline from the previous center to the
+        current center, which is exact for shapes that are only moved. Rotations and resizes between the two
+        poses are only exact at the end of the motion. The other shapes are treated as static. Shapes whose
+        bounds miss the bounds of the swept outline are rejected before any exact test.
+
+        Parameters
+        ----------
+        previous : Shape
+            The shape before the update, usually from snapshot().
+        others : iterable of Shape, optional
+            The shapes to test against. Defaults to all other shapes in the frame.
+
+        Returns
+        -------
+        tuple or None
+            (t, other_shape) for the first impact, where t in [0, 1] is the fraction of the motion at which
+            the shapes touch, or None if the shape hits nothing.
+
+        NOTE: Shapes inside a group are in the local coordinates of the group, call this on the group instead.
+        """
+        if others is None:
+            others = self.frame.list_of_shapes
+        if isinstance(self, Group):
+            pairs = zip(self.get_world_shapes(), previous.get_world_shapes())
+        else:
+            pairs = [(self, previous)]
+        best_t, best_shape = np.inf, None
+        for moving, moved_from in pairs:
+            direction = np.array([moving.center.x - moved_from.center.x, moving.center.y - moved_from.center.y], dtype=np.float64)
+            points, radius = _sweep_geometry(moving)
+            start = (points - direction, radius)
+            xmin, ymin, xmax, ymax = moving.get_bounds()
+            swept = (min(xmin, xmin - direction[0]), min(ymin, ymin - direction[1]), max(xmax, xmax - direction[0]), max(ymax, ymax - direction[1]))
+            for other in others:
+                if other is self or other is previous:
+                    continue
+                # broad phase
+                if isinstance(other, Group):
+                    candidates = other.get_world_shapes(swept)
+                elif _bounds_overlap(other.get_bounds(), swept):
+                    candidates = [other]
+                else:
+                    continue
+                for candidate in candidates:
+                    t = _sweep_toi(start, direction, _sweep_geometry(candidate))
+                    if t < best_t:
+                        best_t, best_shape = t, other
+        if best_shape is None:
+            return None
+        return best_t, best_shape
+
 class Circle(Shape):
     """
     A class to represent a circle.
@@ -179,12 +697,17 @@ class Circle(Shape):
         Returns the points of the circle.
     overlaps(other_shape):
         Returns True if the circle overlaps with another shape.
-    draw(frame):
+    draw(frame, colour=None):
         Draws the circle on a frame.
+    draw_sprite(frame, center, rotation_degrees, colour):
+        Draws the circle at another center, for a SpriteCache.
     
     
 
         """
+    # the float radius stored by the last transform, see _exact
+    _exact_radius = None
+
     def __init__(self, center,frame, radius, colour=(255, 255, 255)):
         """
         Initializes the circle with a center, radius, and colour.
@@ -223,6 +746,43 @@ class Circle(Shape):
         
         self.center = new_center
         self.radius = new_radius
+        self._changed()
+
+    @classmethod
+    def transform_many(cls, shapes, matrix):
+        """
+        Applies a 2x3 affine matrix to many circles at once.
+
+        The radius is scaled by the square root of the area scale of the matrix, so non uniform
+        scales are approximated by a circle of the same area.
+        """
+        super().transform_many(shapes, matrix)
+        matrix = np.asarray(matrix, dtype=np.float64)
+        radius_scale = np.sqrt(abs(np.linalg.det(matrix[:, :2])))
+        if radius_scale == 1:
+            return
+        radii = _exact([[shape.radius for shape in shapes]], [shape._exact_radius for shape in shapes])[:, 0] * radius_scale
+        for shape, radius, exact_radius in zip(shapes, np.rint(radii).astype(np.int64).tolist(), radii.tolist()):
+            shape.radius = radius
+            shape._exact_radius = (exact_radius,)
+
+    def sprite_key(self):
+        """
+        Returns the key of the circle in a SpriteCache.
+        """
+        return ("Circle", self.radius), 0
+
+    def draw_sprite(self, frame, center, rotation_degrees, colour):
+        """
+        Draws a circle of the same radius at another center, used to rasterize stamps for a SpriteCache.
+        """
+        cv2.circle(frame, center, self.radius, colour, -1)
+
+    def get_bounds(self):
+        """
+        Returns the axis aligned bounding box of the circle.
+        """
+        return (self.center.x - self.radius, self.center.y - self.radius, self.center.x + self.radius, self.center.y + self.radius)
 
     def get_points(self):
         """
@@ -235,10 +795,7 @@ class Circle(Shape):
 
         """
         # Approximate the circle with a polygon for intersection tests
-        num_points = 100
-        angles = np.linspace(0, 2 * np.pi, num_points)
-        points = np.array([(self.center.x + self.radius * np.cos(angle), self.center.y + self.radius * np.sin(angle)) for angle in angles], dtype=np.int32)
-        return points
+        return _circle_outlines([(self.center.x, self.center.y, self.radius)])[0]
 
     def overlaps(self, other_shape):
         """
@@ -270,7 +827,7 @@ class Circle(Shape):
             # General case using polygon approximation
             return super().overlaps(other_shape)
 
-    def draw(self, frame):
+    def draw(self, frame, colour=None):
         """
         Draws the circle on a frame.
 
@@ -278,8 +835,11 @@ class Circle(Shape):
         ----------
         frame : np.ndarray         
              The frame to draw the circle on.  
+        colour : tuple or int, optional
+             Overrides the colour of the circle, e.g. with a label. Defaults to the colour of the circle.
         """
-        cv2.circle(frame, (self.center.x, self.center.y), self.radius, self.colour, -1)
+        colour = self.colour if colour is None else colour
+        cv2.circle(frame, (self.center.x, self.center.y), self.radius, colour, -1)
 
 class Rectangle(Shape):
     """
@@ -300,8 +860,10 @@ class Rectangle(Shape):
         Returns the four corner points of the rectangle as a numpy array of integers.
     update(new_center, new_height, new_width, new_rotation_degrees=0):
         Updates the rectangle's center, height, width, and rotation.
-    draw(frame):
+    draw(frame, colour=None):
         Draws the rectangle on the given frame.
+    draw_sprite(frame, center, rotation_degrees, colour):
+        Draws the rectangle at another center and rotation, for a SpriteCache.
     """
     def __init__(self, center,height, width,frame,rotation_degrees=0):
 
@@ -364,25 +926,66 @@ class Rectangle(Shape):
         self.height = new_height
         self.width = new_width
         self.rotation_degrees = new_rotation_degrees
+        self._changed()
+
+    @classmethod
+    def transform_many(cls, shapes, matrix):
+        """
+        Applies a 2x3 affine matrix to many rectangles at once.
+
+        The width and height axes of every rectangle are mapped through the matrix, which gives the new
+        rotation and size. Exact for moves, rotations and scales; a shear is approximated by a rectangle.
+        """
+        super().transform_many(shapes, matrix)
+        linear = np.asarray(matrix, dtype=np.float64)[:, :2]
+        if np.array_equal(linear, np.eye(2)):
+            return
+        params = np.array([np.fromiter([getattr(shape, name) for shape in shapes], dtype=np.float64, count=len(shapes))
+                           for name in ("width", "height", "rotation_degrees")]).T
+        radians = np.radians(params[:, 2])
+        width_axis = np.stack([np.cos(radians), np.sin(radians)], axis=1) @ linear.T
+        height_axis = np.stack([-np.sin(radians), np.cos(radians)], axis=1) @ linear.T
+        widths = params[:, 0] * np.linalg.norm(width_axis, axis=1)
+        heights = params[:, 1] * np.linalg.norm(height_axis, axis=1)
+        rotations = np.degrees(np.arctan2(width_axis[:, 1], width_axis[:, 0]))
+        for shape, width, height, rotation in zip(shapes, widths.tolist(), heights.tolist(), rotations.tolist()):
+            shape.width = width
+            shape.height = height
+            shape.rotation_degrees = rotation
 
 
 
     # def overlaps(self, Shape):
     #     pass
 
-    def draw(self, frame):
+    def draw(self, frame, colour=None):
         """
         Draw the rectangle on the given frame.
 
         Parameters:
         -----------
         frame (numpy.ndarray): The frame on which to draw the rectangle.   
+        colour (tuple or int, optional): Overrides the colour of the rectangle, e.g. with a label.
             
             """
+        colour = self.colour if colour is None else colour
         rect = ((self.center.x, self.center.y), (self.width, self.height), self.rotation_degrees)
         box = cv2.boxPoints(rect)
         box = np.int32(box)
-        cv2.fillPoly(frame, [box], self.colour)
+        cv2.fillPoly(frame, [box], colour)
+
+    def sprite_key(self):
+        """
+        Returns the key of the rectangle in a SpriteCache.
+        """
+        return ("Rectangle", self.width, self.height), self.rotation_degrees
+
+    def draw_sprite(self, frame, center, rotation_degrees, colour):
+        """
+        Draws a rectangle of the same size at another center and rotation, used to rasterize stamps for a SpriteCache.
+        """
+        box = np.int32(cv2.boxPoints((center, (self.width, self.height), rotation_degrees)))
+        cv2.fillPoly(frame, [box], colour)
 
 class Triangle(Shape):
     """
@@ -405,10 +1008,13 @@ class Triangle(Shape):
         Calculates the centroid of the triangle.
     get_points():
         Returns the points of the triangle.
-    draw(frame):
+    draw(frame, colour=None):
         Draws the triangle on a frame.
 
     """
+    # the float vertices stored by the last transform, see _exact
+    _exact_vertices = None
+
     def __init__(self, point1, point2, point3,frame):
         """
         Initializes the triangle with three points.
@@ -445,6 +1051,16 @@ class Triangle(Shape):
         centroid_x = (self.point1.x + self.point2.x + self.point3.x) / 3
         centroid_y = (self.point1.y + self.point2.y + self.point3.y) / 3
         return Point(centroid_x, centroid_y)
+
+    def snapshot(self):
+        """
+        Returns a copy of the triangle that is not affected by later updates of the triangle.
+        """
+        snap = super().snapshot()
+        snap.point1 = Point(self.point1.x, self.point1.y)
+        snap.point2 = Point(self.point2.x, self.point2.y)
+        snap.point3 = Point(self.point3.x, self.point3.y)
+        return snap
     
     def update(self, point1, point2, point3):
         """
@@ -462,6 +1078,28 @@ class Triangle(Shape):
         self.point1 = point1
         self.point2 = point2
         self.point3 = point3
+        self._changed()
+
+    @classmethod
+    def transform_many(cls, shapes, matrix):
+        """
+        Applies a 2x3 affine matrix to the vertices of many triangles at once and recomputes the centroids.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        vertices = _exact([[shape.point1.x for shape in shapes], [shape.point1.y for shape in shapes],
+                           [shape.point2.x for shape in shapes], [shape.point2.y for shape in shapes],
+                           [shape.point3.x for shape in shapes], [shape.point3.y for shape in shapes]],
+                          [shape._exact_vertices for shape in shapes])
+        vertices = _apply_affine(vertices.reshape(-1, 3, 2), matrix).reshape(-1, 6)
+        rounded = np.rint(vertices).astype(np.int64)
+        centroids = np.rint(vertices.reshape(-1, 3, 2).mean(axis=1)).astype(np.int64)
+        for shape, x1, y1, x2, y2, x3, y3, cx, cy, exact_vertices in zip(shapes, *rounded.T.tolist(), *centroids.T.tolist(), zip(*vertices.T.tolist())):
+            shape.point1 = Point(x1, y1)
+            shape.point2 = Point(x2, y2)
+            shape.point3 = Point(x3, y3)
+            shape.center = Point(cx, cy)
+            shape._exact_vertices = exact_vertices
+            shape._changed()
 
     def get_points(self):
         """
@@ -476,7 +1114,7 @@ class Triangle(Shape):
         """
         return np.array([[self.point1.x, self.point1.y], [self.point2.x, self.point2.y], [self.point3.x, self.point3.y]]) 
 
-    def draw(self, frame):
+    def draw(self, frame, colour=None):
         """
         Draws the triangle on a frame.
 
@@ -484,7 +1122,653 @@ class Triangle(Shape):
         ----------
         frame : np.ndarray
             The frame to draw the triangle on.
+        colour : tuple or int, optional
+            Overrides the colour of the triangle, e.g. with a label. Defaults to the colour of the triangle.
         """
+        colour = self.colour if colour is None else colour
         points = self.get_points()
-        cv2.fillPoly(frame, [points], self.colour)
+        cv2.fillPoly(frame, [points], colour)
 
+class Polygon(Shape):
+    """
+    A class to represent an arbitrary simple polygon, convex or concave.
+
+    Everything that only depends on the outline is computed once when the outline changes: a triangulation,
+    a table of the edges with their bounds and inverse slopes, and the bounds of the polygon. Containment and
+    overlap tests are then exact and vectorized over the edges, which also holds for concave outlines where
+    cv2.intersectConvexConvex is wrong.
+
+    Attributes
+    ----------
+    points : list
+        The vertices of the polygon as Points, in order.
+    center : Point
+        The centroid of the area of the polygon.
+    triangles : np.ndarray
+        (n - 2, 3) vertex indices of a triangulation of the polygon.
+    frame : Frame
+        The frame to draw the polygon on.
+    colour : tuple
+        The colour of the polygon. In BGR format.
+
+    Methods
+    -------
+    update(points):
+        Replaces the vertices of the polygon.
+    get_points():
+        Returns the vertices of the polygon.
+    get_bounds():
+        Returns the cached bounding box of the polygon.
+    area():
+        Returns the area of the polygon.
+    contains(point):
+        Returns True if the point is contained within the polygon.
+    contains_points(points):
+        Returns which of many points are contained within the polygon.
+    overlaps(other_shape):
+        Returns True if the polygon overlaps with another shape.
+    draw(frame, colour=None):
+        Draws the polygon on a frame.
+    """
+    # the float vertices stored by the last transform, see _exact
+    _exact_vertices = None
+
+    def __init__(self, points, frame, colour=(255, 255, 255)):
+        """
+        Initializes the polygon with its vertices.
+
+        Parameters
+        ----------
+        points : list of Point
+            The vertices of the polygon, at least 3, in order around the outline.
+        frame : Frame
+            The frame to draw the polygon on.
+        colour : tuple
+            The colour of the polygon in BGR format.
+        """
+        self._set_points(points)
+        self.triangles = _triangulate(self._vertices)
+        super().__init__(self._calculate_centroid(), frame, colour)
+
+    def _set_points(self, points):
+        """
+        Stores the vertices and rebuilds the edge table and bounds.
+        """
+        if len(points) < 3:
+            raise ValueError(f"A polygon needs at least 3 points, got {len(points)}")
+        self.points = list(points)
+        self._vertices = np.array([(point.x, point.y) for point in self.points], dtype=np.float64)
+        self._build_tables()
+
+    def _build_tables(self):
+        """
+        Builds the edge table and bounds from self._vertices.
+        """
+        start, end = _edges(self._vertices)
+        self._edge_start = start
+        self._edge_end = end
+        self._edge_bounds = np.hstack([np.minimum(start, end), np.maximum(start, end)])
+        dy = end[:, 1] - start[:, 1]
+        # horizontal edges are never crossed by the horizontal ray, their slope is irrelevant
+        self._inverse_slopes = np.divide(end[:, 0] - start[:, 0], dy, out=np.zeros_like(dy), where=dy != 0)
+        self._bounds = (*self._vertices.min(axis=0).tolist(), *self._vertices.max(axis=0).tolist())
+
+    def _calculate_centroid(self):
+        """
+        Returns the centroid of the area of the polygon, computed from the triangulation.
+        """
+        corners = self._vertices[self.triangles]
+        areas = np.abs(_cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]))
+        if areas.sum() == 0:
+            return Point(*np.rint(self._vertices.mean(axis=0)))
+        return Point(*np.rint((corners.mean(axis=1) * areas[:, None]).sum(axis=0) / areas.sum()))
+
+    def update(self, points):
+        """
+        Replaces the vertices of the polygon and recomputes the cached data.
+
+        Parameters
+        ----------
+        points : list of Point
+            The new vertices of the polygon.
+        """
+        self._set_points(points)
+        self.triangles = _triangulate(self._vertices)
+        self.center = self._calculate_centroid()
+        self._changed()
+
+    @classmethod
+    def transform_many(cls, shapes, matrix):
+        """
+        Applies a 2x3 affine matrix to the vertices of many polygons at once.
+
+        The vertices of all polygons are transformed in one pass. An affine map keeps the triangulation
+        valid, so only the edge tables and bounds are rebuilt.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        # NOTE: a polygon whose number of vertices changed since its last transform uses its rounded vertices
+        stored = [shape._exact_vertices for shape in shapes]
+        vertices = _exact(np.concatenate([shape._vertices for shape in shapes]).T,
+                          [row for shape, exact in zip(shapes, stored) for row in (exact.tolist() if exact is not None and len(exact) == len(shape._vertices) else [None] * len(shape._vertices))])
+        vertices = _apply_affine(vertices, matrix)
+        offsets = np.cumsum([len(shape.points) for shape in shapes])[:-1]
+        for shape, exact_vertices in zip(shapes, np.split(vertices, offsets)):
+            shape_vertices = np.rint(exact_vertices)
+            shape.points = [Point(x, y) for x, y in shape_vertices.tolist()]
+            shape._vertices = shape_vertices
+            shape._exact_vertices = exact_vertices
+            shape._build_tables()
+            shape.center = shape._calculate_centroid()
+            shape._changed()
+
+    def snapshot(self):
+        """
+        Returns a copy of the polygon that is not affected by later updates of the polygon.
+        """
+        snap = super().snapshot()
+        snap.points = [Point(point.x, point.y) for point in self.points]
+        return snap
+
+    def get_points(self):
+        """
+        Returns the vertices of the polygon.
+
+        Returns
+        -------
+        np.ndarray
+            (n, 2) array of the vertices.
+        """
+        return self._vertices.astype(np.int32)
+
+    def get_bounds(self):
+        """
+        Returns the cached bounding box of the polygon.
+        """
+        return self._bounds
+
+    def area(self):
+        """
+        Returns the area of the polygon.
+        """
+        return abs(float(np.sum(_cross(self._edge_start, self._edge_end)))) / 2
+
+    def contains_points(self, points):
+        """
+        Returns which of many points are contained within the polygon.
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (n, 2) array of point coordinates.
+
+        Returns
+        -------
+        np.ndarray
+            (n,) bool array, True for points inside the polygon or on its outline.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xmin, ymin, xmax, ymax = self._bounds
+        result = np.zeros(len(points), dtype=bool)
+        candidates = np.flatnonzero((points[:, 0] >= xmin) & (points[:, 0] <= xmax) & (points[:, 1] >= ymin) & (points[:, 1] <= ymax))
+        if len(candidates) == 0:
+            return result
+        px = points[candidates, 0, None]
+        py = points[candidates, 1, None]
+        start_y = self._edge_start[:, 1]
+        crosses = (start_y > py) != (self._edge_end[:, 1] > py)
+        x_intersect = self._edge_start[:, 0] + (py - start_y) * self._inverse_slopes
+        inside = np.count_nonzero(crosses & (px < x_intersect), axis=1) % 2 == 1
+        # the crossing number leaves out parts of the outline, which count as inside like for the other shapes
+        outside = np.flatnonzero(~inside)
+        if len(outside):
+            distances = _segment_distances(points[candidates[outside], None], self._edge_start, self._edge_end)
+            inside[outside] = distances.min(axis=1) <= EDGE_TOLERANCE
+        result[candidates] = inside
+        return result
+
+    def contains(self, point):
+        """
+        Returns True if the point is contained within the polygon.
+
+        Parameters
+        ----------
+        point : Point
+            The point to check.
+        """
+        return bool(self.contains_points([(point.x, point.y)])[0])
+
+    def _edges_near(self, bounds):
+        """
+        Returns the start and end points of the edges whose bounds overlap the given bounds.
+        """
+        edge_bounds = self._edge_bounds
+        near = (edge_bounds[:, 0] <= bounds[2]) & (edge_bounds[:, 2] >= bounds[0]) & (edge_bounds[:, 1] <= bounds[3]) & (edge_bounds[:, 3] >= bounds[1])
+        return self._edge_start[near], self._edge_end[near]
+
+    def overlaps(self, other_shape):
+        """
+        Returns True if the polygon overlaps with another shape.
+
+        Circles are tested against the edges exactly, all other shapes by their outline. Only edges whose
+        bounds overlap the bounds of the other shape are tested.
+
+        Parameters
+        ----------
+        other_shape : Shape
+            The other shape to check for overlap.
+
+        Returns
+        -------
+        bool
+            True if the polygon overlaps with the other shape.
+        """
+        if isinstance(other_shape, Group):
+            return other_shape.overlaps(self)
+        other_bounds = other_shape.get_bounds()
+        if not _bounds_overlap(self._bounds, other_bounds):
+            return False
+        if isinstance(other_shape, Circle):
+            center = np.array([other_shape.center.x, other_shape.center.y], dtype=np.float64)
+            if self.contains(other_shape.center):
+                return True
+            start, end = self._edges_near(other_bounds)
+            return bool(len(start) > 0 and _point_segments_distance(center, start, end) <= other_shape.radius)
+        if isinstance(other_shape, Polygon):
+            other_vertices = other_shape._vertices
+            other_start, other_end = other_shape._edges_near(self._bounds)
+        else:
+            other_vertices = np.asarray(other_shape.get_points(), dtype=np.float64).reshape(-1, 2)
+            other_start, other_end = _edges(other_vertices)
+        # a vertex of one inside the other is the cheap and common case, crossing edges the expensive one
+        if self.contains_points(other_vertices[:1])[0] or _points_in_polygon(self._vertices[:1], other_vertices)[0]:
+            return True
+        start, end = self._edges_near(other_bounds)
+        return bool(len(start) > 0 and len(other_start) > 0 and _segments_intersect(start, end, other_start, other_end))
+
+    def draw(self, frame, colour=None):
+        """
+        Draws the polygon on a frame.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The frame to draw the polygon on.
+        colour : tuple or int, optional
+            Overrides the colour of the polygon, e.g. with a label. Defaults to the colour of the polygon.
+        """
+        colour = self.colour if colour is None else colour
+        cv2.fillPoly(frame, [self.get_points()], colour)
+
+class Group(Shape):
+    """
+    A class to represent a group of shapes and subgroups that behave as one shape.
+
+    The children are defined in the local coordinates of the group and placed in the frame by the local
+    transform of the group. Moving, rotating or scaling a group only changes its local transform, no matter
+    how many children it has. The bounding box of the children is cached and recomputed lazily after a child
+    changes, and contains, overlaps and draw skip every subtree whose bounds can not be hit.
+
+    Attributes
+    ----------
+    children : list
+        The shapes and subgroups in the group.
+    local_transform : np.ndarray
+        The 2x3 affine matrix from the local coordinates of the group to the coordinates of its parent.
+    center : Point
+        The origin of the local coordinates of the group, in the coordinates of its parent.
+    frame : Frame
+        The frame the group is drawn in.
+
+    Methods
+    -------
+    add(shape):
+        Adds a shape or subgroup to the group.
+    remove(shape):
+        Removes a shape or subgroup from the group.
+    set_transform(matrix):
+        Replaces the local transform of the group.
+    rotate(degrees, origin=None):
+        Rotates the group around origin, by default around the center of its bounds.
+    scale(factor, origin=None):
+        Scales the group around origin, by default around the center of its bounds.
+    world_transform():
+        Returns the transform from local coordinates to frame coordinates.
+    get_bounds():
+        Returns the cached bounding box of the group.
+    get_world_shapes(region=None):
+        Returns copies of all shapes in the group in frame coordinates.
+    contains(point):
+        Returns True if the point is contained within any shape in the group.
+    overlaps(other_shape):
+        Returns True if any shape in the group overlaps with another shape.
+    draw(frame, colour=None):
+        Draws all shapes in the group on a frame.
+    """
+    def __init__(self, frame, shapes=(), transform=None):
+        """
+        Initializes the group and adds the given shapes to it.
+
+        Parameters
+        ----------
+        frame : Frame
+            The frame to draw the group in.
+        shapes : iterable of Shape, optional
+            The shapes to add, see add().
+        transform : np.ndarray, optional
+            The initial local transform. Defaults to the identity.
+        """
+        self.children = []
+        self.local_transform = IDENTITY.copy() if transform is None else np.asarray(transform, dtype=np.float64)
+        # cached bounds of the children in local coordinates and of the group in parent coordinates
+        self._local_bounds = None
+        self._child_bounds = None
+        self._bounds = None
+        # cached children in frame coordinates, see _world_children
+        self._world_cache = None
+        super().__init__(Point(*np.rint(self.local_transform[:, 2])), frame)
+        for shape in shapes:
+            self.add(shape)
+
+    def add(self, shape):
+        """
+        Adds a shape or subgroup to the group.
+
+        The shape is taken out of the frame or its previous group. Its current coordinates are used as
+        local coordinates of this group.
+
+        Parameters
+        ----------
+        shape : Shape
+            The shape to add.
+        """
+        if shape.parent is not None:
+            shape.parent.remove(shape)
+        elif shape in self.frame.list_of_shapes:
+            self.frame.remove_shape(shape)
+        shape.parent = self
+        self.children.append(shape)
+        self._child_changed()
+
+    def remove(self, shape):
+        """
+        Removes a shape or subgroup from the group. The shape is not added back to the frame, call add_to_frame() for that.
+
+        Parameters
+        ----------
+        shape : Shape
+            The shape to remove.
+        """
+        self.children.remove(shape)
+        shape.parent = None
+        self._child_changed()
+
+    def _child_changed(self):
+        """
+        Invalidates the cached bounds after a child changed.
+        """
+        # the caches of the ancestors are always stale when ours is, so there is nothing left to do
+        if self._local_bounds is None:
+            return
+        self._local_bounds = None
+        self._bounds = None
+        self._world_cache = None
+        self._changed()
+
+    def set_transform(self, matrix):
+        """
+        Replaces the local transform of the group.
+
+        Parameters
+        ----------
+        matrix : np.ndarray
+            The 2x3 affine matrix from local coordinates to the coordinates of the parent.
+        """
+        self.local_transform = np.asarray(matrix, dtype=np.float64)
+        self.center = Point(*np.rint(self.local_transform[:, 2]))
+        self._bounds = None
+        self._changed()
+
+    def _bounds_center(self):
+        """
+        Returns the center of the bounds of the group in the coordinates of its parent, the origin of the local
+        coordinates for an empty group.
+        """
+        xmin, ymin, xmax, ymax = self.get_bounds()
+        if xmin > xmax:
+            return self.center
+        return Point((xmin + xmax) / 2, (ymin + ymax) / 2)
+
+    def rotate(self, degrees, origin=None):
+        """
+        Rotates the group by degrees around origin.
+
+        Parameters
+        ----------
+        degrees : float
+            The rotation in degrees, in the same direction as Rectangle.rotation_degrees.
+        origin : Point, optional
+            The point to rotate around, in the coordinates of the parent. Defaults to the center of the bounds
+            of the group, the center attribute is the origin of the local coordinates.
+        """
+        super().rotate(degrees, self._bounds_center() if origin is None else origin)
+
+    def scale(self, factor, origin=None):
+        """
+        Scales the group by factor around origin.
+
+        Parameters
+        ----------
+        factor : float
+            The scale factor.
+        origin : Point, optional
+            The point to scale around, in the coordinates of the parent. Defaults to the center of the bounds
+            of the group.
+        """
+        super().scale(factor, self._bounds_center() if origin is None else origin)
+
+    @classmethod
+    def transform_many(cls, shapes, matrix):
+        """
+        Applies a 2x3 affine matrix to many groups by updating their local transforms.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        for group in shapes:
+            group.set_transform(_compose(matrix, group.local_transform))
+
+    def world_transform(self):
+        """
+        Returns the 2x3 affine matrix from the local coordinates of the group to frame coordinates.
+        """
+        if self.parent is None:
+            return self.local_transform
+        return _compose(self.parent.world_transform(), self.local_transform)
+
+    def _parent_world(self):
+        """
+        Returns the 2x3 affine matrix from the coordinates of the parent to frame coordinates.
+        """
+        return IDENTITY if self.parent is None else self.parent.world_transform()
+
+    def get_local_bounds(self):
+        """
+        Returns the cached bounding box of the children in local coordinates.
+        """
+        if self._local_bounds is None:
+            bounds = EMPTY_BOUNDS
+            for child in self.children:
+                child_bounds = child.get_bounds()
+                bounds = (min(bounds[0], child_bounds[0]), min(bounds[1], child_bounds[1]), max(bounds[2], child_bounds[2]), max(bounds[3], child_bounds[3]))
+            # the bounds of every child as an (n, 4) array, for contains
+            self._child_bounds = np.array([child.get_bounds() for child in self.children], dtype=np.float64).reshape(-1, 4)
+            self._local_bounds = bounds
+        return self._local_bounds
+
+    def get_bounds(self):
+        """
+        Returns the cached bounding box of the group in the coordinates of its parent, i.e. frame coordinates
+        for a group directly in the frame. An empty group has the bounds (inf, inf, -inf, -inf).
+        """
+        if self._bounds is None:
+            self._bounds = _transform_bounds(self.get_local_bounds(), self.local_transform)
+        return self._bounds
+
+    def get_points(self):
+        """
+        Returns the corners of the bounding box of the group in the coordinates of its parent.
+        """
+        xmin, ymin, xmax, ymax = self.get_bounds()
+        return np.array([[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax]])
+
+    def snapshot(self):
+        """
+        Returns a copy of the group and all its children that is not affected by later updates.
+        """
+        snap = super().snapshot()
+        snap.local_transform = self.local_transform.copy()
+        # the cache can refer to the children of the group, not to the copies
+        snap._world_cache = None
+        snap.children = []
+        for child in self.children:
+            child_snap = child.snapshot()
+            child_snap.parent = snap
+            snap.children.append(child_snap)
+        return snap
+
+    def _world_children(self, parent_world):
+        """
+        Returns the world transform of the group, its children in frame coordinates and their bounds in frame
+        coordinates as an (n, 4) array. Subgroups are returned as they are.
+
+        The result is cached until a child changes or the world transform of the group changes, e.g. because
+        an ancestor was moved. The shapes of each class are transformed together with transform_many.
+        """
+        world = _compose(parent_world, self.local_transform)
+        cache = self._world_cache
+        if cache is not None and np.array_equal(cache[0], world):
+            return cache
+        # NOTE: _child_changed only clears the cache of a group whose bounds are cached, so cache them too
+        self.get_local_bounds()
+        entries = list(self.children)
+        if not np.array_equal(world, IDENTITY):
+            by_class = {}
+            for index, child in enumerate(self.children):
+                if not isinstance(child, Group):
+                    entries[index] = child.snapshot()
+                    by_class.setdefault(type(child), []).append(entries[index])
+            for cls, snaps in by_class.items():
+                cls.transform_many(snaps, world)
+        bounds = np.array([_transform_bounds(entry.get_bounds(), world) if isinstance(entry, Group) else entry.get_bounds() for entry in entries], dtype=np.float64).reshape(-1, 4)
+        self._world_cache = (world, entries, bounds)
+        return self._world_cache
+
+    def _iter_world_shapes(self, parent_world, region):
+        """
+        Yields the shapes in the subtree in frame coordinates, skipping subtrees whose bounds miss region.
+        """
+        world, entries, bounds = self._world_children(parent_world)
+        if region is None:
+            hit = [True] * len(entries)
+        else:
+            hit = ((bounds[:, 0] <= region[2]) & (bounds[:, 2] >= region[0]) & (bounds[:, 1] <= region[3]) & (bounds[:, 3] >= region[1])).tolist()
+        for entry, entry_hit in zip(entries, hit):
+            if not entry_hit:
+                continue
+            if isinstance(entry, Group):
+                yield from entry._iter_world_shapes(world, region)
+            else:
+                yield entry
+
+    def get_world_shapes(self, region=None):
+        """
+        Returns all shapes in the group in frame coordinates.
+
+        Shapes that are not moved by the group are returned as they are, all others as transformed snapshots.
+        The snapshots are cached by the group and must not be changed.
+
+        Parameters
+        ----------
+        region : tuple, optional
+            Bounds (xmin, ymin, xmax, ymax) in frame coordinates. Only shapes whose bounds overlap the region are returned.
+
+        Returns
+        -------
+        list
+            The shapes in frame coordinates.
+        """
+        parent_world = self._parent_world()
+        if region is not None and not _bounds_overlap(_transform_bounds(self.get_bounds(), parent_world), region):
+            return []
+        return list(self._iter_world_shapes(parent_world, region))
+
+    def contains(self, point):
+        """
+        Returns True if the point is contained within any shape in the group.
+
+        The children are tested in local coordinates, so moving the group does not rebuild its world shapes. The
+        result can differ on the outline by a pixel from the drawn shapes, whose points are rounded in frame
+        coordinates.
+
+        Parameters
+        ----------
+        point : Point
+            The point to check, in frame coordinates.
+        """
+        world = self.world_transform()
+        if not _is_similarity(world):
+            # the world shapes of e.g. a circle in a stretched group are not the stretched local shapes
+            region = (point.x, point.y, point.x, point.y)
+            return any(shape.contains(point) for shape in self.get_world_shapes(region))
+        # the point is mapped into the local coordinates instead of moving the children out of them, so moving
+        # the group does not rebuild the world shapes
+        x, y = _apply_affine(np.array([point.x, point.y], dtype=np.float64), _invert(world))
+        return self._contains_local(x, y)
+
+    def _contains_local(self, x, y):
+        """
+        Returns True if the point (x, y) in local coordinates is contained within any shape in the group.
+        """
+        # NOTE: rounded to drop the float error of the inverse transform, so points on an outline stay on it
+        x, y = round(float(x), 9), round(float(y), 9)
+        xmin, ymin, xmax, ymax = self.get_local_bounds()
+        if not (xmin <= x <= xmax and ymin <= y <= ymax):
+            return False
+        bounds = self._child_bounds
+        hit = np.flatnonzero((bounds[:, 0] <= x) & (bounds[:, 2] >= x) & (bounds[:, 1] <= y) & (bounds[:, 3] >= y))
+        for index in hit.tolist():
+            child = self.children[index]
+            if isinstance(child, Group):
+                if child._contains_local(*_apply_affine(np.array([x, y]), _invert(child.local_transform))):
+                    return True
+            elif child.contains(Point(x, y)):
+                return True
+        return False
+
+    def overlaps(self, other_shape):
+        """
+        Returns True if any shape in the group overlaps with another shape or group.
+
+        Parameters
+        ----------
+        other_shape : Shape
+            The other shape, in frame coordinates.
+        """
+        if isinstance(other_shape, Group):
+            region = _transform_bounds(other_shape.get_bounds(), other_shape._parent_world())
+        else:
+            region = other_shape.get_bounds()
+        return any(shape.overlaps(other_shape) for shape in self.get_world_shapes(region))
+
+    def draw(self, frame, colour=None):
+        """
+        Draws all shapes in the group on a frame. Shapes outside of the frame are skipped.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The frame to draw on.
+        colour : tuple or int, optional
+            Overrides the colour of every shape in the group, e.g. with a label.
+        """
+        region = (0, 0, frame.shape[1] - 1, frame.shape[0] - 1)
+        for shape in self.get_world_shapes(region):
+            shape.draw(frame, colour)
@@ -0,0 +1,416 @@
+"""
+Module Name: sprites.py
+Description: This module contains the SpriteCache class, a bounded LRU cache of pre-rasterized shapes. Frames that
+contain many shapes with the same size, rotation and colour draw them by copying a cached stamp instead of
+rasterizing every shape with OpenCV.
+
+Author: Nandu Jagdish
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# batches of one colour that cover at least 1 / DENSE_COVERAGE of the rows they span are composed in a mask
+DENSE_COVERAGE = 16
+
+
+class Sprite():
+    """
+    A pre-rasterized shape.
+
+    Attributes
+    ----------
+    image : np.ndarray
+        The rasterized shape in BGR, cropped to the mask. None for sprites of 1-channel targets, which are filled
+        with one value per shape.
+    mask : np.ndarray
+        The pixels covered by the shape, cropped to their bounding box.
+    top, left : int
+        The position of mask[0, 0] relative to the center of the shape.
+    rows, cols : np.ndarray
+        The covered pixels relative to the center of the shape.
+    values : np.ndarray
+        The colours of the covered pixels, None for 1-channel targets.
+    colour : tuple
+        The colour of every covered pixel if they all have the same colour, None otherwise.
+    nbytes : int
+        The memory used by the sprite.
+    """
+    def __init__(self, image, mask, offset):
+        rows, cols = np.nonzero(mask)
+        if len(rows) == 0:
+            rows = cols = np.zeros(0, np.intp)
+            top = bottom = left = right = offset
+        else:
+            top, bottom, left, right = rows.min(), rows.max() + 1, cols.min(), cols.max() + 1
+        self.mask = mask[top:bottom, left:right].astype(bool)
+        self.image = None if image is None else image[top:bottom, left:right].copy()
+        self.top = int(top) - offset
+        self.left = int(left) - offset
+        self.values = None if image is None else image[rows, cols]
+        self.colour = None
+        if self.values is not None and len(self.values) and (self.values == self.values[0]).all():
+            self.colour = tuple(self.values[0].tolist())
+        self.rows = rows - offset
+        self.cols = cols - offset
+        self.nbytes = sum(array.nbytes for array in (self.image, self.mask, self.rows, self.cols, self.values) if array is not None)
+
+
+class SpriteCache():
+    """
+    A bounded LRU cache of pre-rasterized shapes (stamps), keyed by shape type, dimensions, rotation bucket and colour.
+
+    Shapes opt in by implementing sprite_key() and draw_sprite(), see Circle and Rectangle. All other shapes are
+    drawn as usual. Rotations are rounded to multiples of rotation_step, so a cached stamp can be rotated by up to
+    half a step less or more than the shape, and a rotated rectangle that crosses the edge of the buffer can be a
+    pixel off along the edge, as OpenCV clips polygons before filling them.
+
+    The shapes without stamps are drawn directly first, in order, and also numbered in an owner map of the buffer.
+    The shapes with stamps are then drawn as one batch in which the pixels of all shapes with the same stamp are
+    found with one numpy operation. A pixel of a stamp is only written where no shape drawn directly after it
+    covers it, and where stamps of different colours or labels overlap, the pixel gets the value of the shape that
+    comes last in the list, so the result is the same as if the shapes were drawn one by one.
+
+    The batch has a fixed cost of a few numpy operations and a per-pixel cost, while OpenCV draws a small circle
+    about as fast as the cache looks up its stamp, so the cache pays off for many shapes that are slow to draw,
+    such as rotated rectangles, and not for a few shapes or small circles.
+
+    Attributes
+    ----------
+    max_bytes : int
+        The memory cap of the cache. Least recently used stamps are evicted to stay below it.
+    min_batch_size : int
+        Frames with fewer shapes that can be drawn from a stamp than this are drawn directly.
+    max_sprite_size : int
+        Shapes that span this many pixels or more on a side are drawn directly. Copying a stamp is done pixel by
+        pixel, so it only beats OpenCV, which fills whole rows at once, for small shapes.
+    rotation_step : float
+        The size of a rotation bucket in degrees.
+    hits : int
+        The number of shapes drawn from a stamp.
+    misses : int
+        The number of stamps that were rasterized.
+    evictions : int
+        The number of stamps evicted to stay below max_bytes.
+
+    Methods
+    -------
+    draw_shapes(shapes, buffer, colours=None):
+        Draws shapes on a buffer, using cached stamps where possible.
+    stats():
+        Returns the hit/miss statistics and the memory use.
+    clear():
+        Removes all stamps.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_sprite_size=16, rotation_step=1.0, min_batch_size=256):
+        self.max_bytes = max_bytes
+        self.min_batch_size = min_batch_size
+        self.max_sprite_size = max_sprite_size
+        self.rotation_step = rotation_step
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sprites = OrderedDict()
+        self._nbytes = 0
+        # the half size of the stamp of every key seen so far, None for shapes that are drawn directly as they are too large
+        self._offsets = {}
+        # the render thread of a double buffered frame draws concurrently with the caller
+        self._lock = threading.Lock()
+        # owner maps and the number of the next shape drawn on them, and zeroed scratch arrays, kept between frames
+        # as allocating them is slow for large buffers
+        self._owners = {}
+        self._scratch = {}
+
+    def _offset(self, key, shape):
+        """
+        Returns the half size of the stamp of a key, the distance from the center of the shape to the edge of the
+        stamp. None if the shapes of the key are too large to be drawn from a stamp.
+        """
+        with self._lock:
+            if key in self._offsets:
+                return self._offsets[key]
+        xmin, ymin, xmax, ymax = shape.get_bounds()
+        offset = None
+        if max(xmax - xmin, ymax - ymin) < self.max_sprite_size:
+            cx, cy = shape.center.x, shape.center.y
+            # the stamp is rotated by up to half a rotation step more or less than the shape, the margin covers that
+            offset = int(np.ceil(max(cx - xmin, xmax - cx, cy - ymin, ymax - cy))) + 2
+        with self._lock:
+            self._offsets[key] = offset
+        return offset
+
+    def _get(self, key, rotation_degrees, shape, channels, colour, offset):
+        """
+        Returns the stamp for a key, rasterizing and caching it on a miss.
+        """
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                return sprite
+            self.misses += 1
+        size = 2 * offset + 1
+        mask = np.zeros((size, size), np.uint8)
+        shape.draw_sprite(mask, (offset, offset), rotation_degrees, 255)
+        image = None
+        if channels == 3:
+            image = np.zeros((size, size, 3), np.uint8)
+            shape.draw_sprite(image, (offset, offset), rotation_degrees, colour)
+        sprite = Sprite(image, mask, offset)
+        if sprite.nbytes > self.max_bytes:
+            return sprite
+        with self._lock:
+            if key not in self._sprites:
+                self._sprites[key] = sprite
+                self._nbytes += sprite.nbytes
+                while self._nbytes > self.max_bytes:
+                    _, evicted = self._sprites.popitem(last=False)
+                    self._nbytes -= evicted.nbytes
+                    self.evictions += 1
+        return sprite
+
+    def draw_shapes(self, shapes, buffer, colours=None):
+        """
+        Draws shapes on a buffer in order, using cached stamps where possible.
+
+        Parameters
+        ----------
+        shapes : list of Shape
+            The shapes to draw.
+        buffer : np.ndarray
+            The BGR image or 1-channel mask or label map to draw on.
+        colours : iterable, optional
+            One colour override per shape (see Shape.draw), None to draw every shape in its own colour.
+        """
+        colours = [shape.colour for shape in shapes] if colours is None else list(colours)
+        if len(shapes) < self.min_batch_size:
+            for shape, colour in zip(shapes, colours):
+                shape.draw(buffer, colour)
+            return
+        channels = 3 if buffer.ndim == 3 else 1
+        step = self.rotation_step
+        buckets = int(round(360 / step))
+        # every distinct stamp gets an index, -1 for shapes that are drawn directly
+        resolved = {}
+        indices = {}
+        keys = []
+        sprite_keys = [shape.sprite_key() for shape in shapes]
+        # 1-channel targets are filled with one value per shape, so their stamps do not depend on the colour
+        colour_keys = [tuple(colour) for colour in colours] if channels == 3 else [None] * len(shapes)
+        key_ids = []
+        for shape, sprite_key, colour, colour_key in zip(shapes, sprite_keys, colours, colour_keys):
+            key_id = resolved.get((sprite_key, colour_key))
+            if key_id is None:
+                key_id = -1
+                if sprite_key is not None:
+                    shape_key, rotation_degrees = sprite_key
+                    bucket = int(round(rotation_degrees / step)) % buckets if rotation_degrees else 0
+                    key = (shape_key, bucket, colour_key)
+                    key_id = indices.get(key)
+                    if key_id is None:
+                        offset = self._offset(key, shape)
+                        key_id = indices[key] = -1 if offset is None else len(keys)
+                        if offset is not None:
+                            keys.append((key, bucket * step, shape, colour, offset))
+                resolved[(sprite_key, colour_key)] = key_id
+            key_ids.append(key_id)
+        key_ids = np.array(key_ids, dtype=np.intp)
+        stamped = np.flatnonzero(key_ids >= 0)
+        sprites = [None] * len(keys)
+        if len(stamped) >= self.min_batch_size:
+            # stamps are only rasterized when they are drawn
+            for key_id in np.unique(key_ids[stamped]).tolist():
+                key, rotation_degrees, shape, colour, offset = keys[key_id]
+                sprites[key_id] = self._get(key, rotation_degrees, shape, channels, colour, offset)
+        if len(stamped) < self.min_batch_size or (channels == 3 and any(sprite.colour is None for sprite in sprites)):
+            for shape, colour in zip(shapes, colours):
+                shape.draw(buffer, colour)
+            return
+        rows = np.array([shapes[index].center.y for index in stamped.tolist()], dtype=np.intp)
+        cols = np.array([shapes[index].center.x for index in stamped.tolist()], dtype=np.intp)
+        direct = np.flatnonzero(key_ids < 0).tolist()
+        if not direct:
+            self._draw_batch(sprites, key_ids[stamped], stamped, rows, cols, [colours[index] for index in stamped.tolist()], buffer)
+            return
+        # the number of the last shape drawn directly that covers each pixel, so the stamps of the shapes after it
+        # are drawn over it
+        owners, first = self._take_owners(buffer.shape[:2], len(shapes))
+        for index in direct:
+            shapes[index].draw(buffer, colours[index])
+            shapes[index].draw(owners, first + index)
+        self._draw_batch(sprites, key_ids[stamped], stamped + first, rows, cols, [colours[index] for index in stamped.tolist()], buffer, owners)
+        with self._lock:
+            self._owners[buffer.shape[:2]] = owners, first + len(shapes)
+
+    def _draw_batch(self, sprites, sprite_ids, order, rows, cols, colours, buffer, owners=None):
+        """
+        Copies the stamps of a batch of shapes into a buffer at the centers of the shapes (rows, cols), clipped to
+        the buffer. The shapes with the same stamp are copied with one numpy operation. order is the increasing number of
+        every shape in drawing order, a pixel is only written where it is larger than the number in owners.
+        """
+        if buffer.ndim == 3:
+            palette = np.zeros((len(sprites), 3), buffer.dtype)
+            for sprite_id in np.unique(sprite_ids).tolist():
+                palette[sprite_id] = sprites[sprite_id].colour
+            palette = palette[sprite_ids]
+        else:
+            palette = np.array(colours, dtype=buffer.dtype).reshape(-1, 1)
+        with self._lock:
+            self.hits += len(sprite_ids)
+        height, width = buffer.shape[:2]
+        # the flat pixels of the buffer covered by the copies of every stamp, and the shapes with their pixel counts
+        by_sprite = np.argsort(sprite_ids, kind="stable").astype(np.int32)
+        pixels, shape_index = [], []
+        for indices in np.split(by_sprite, np.flatnonzero(np.diff(sprite_ids[by_sprite])) + 1):
+            sprite = sprites[sprite_ids[indices[0]]]
+            sprite_rows, sprite_cols = rows[indices], cols[indices]
+            edge = ((sprite_rows + sprite.top < 0) | (sprite_cols + sprite.left < 0)
+                    | (sprite_rows + sprite.top + sprite.mask.shape[0] > height) | (sprite_cols + sprite.left + sprite.mask.shape[1] > width))
+            if edge.any():
+                # only the shapes that cross the edge of the buffer need their pixels checked
+                edge_rows = sprite_rows[edge][:, None] + sprite.rows
+                edge_cols = sprite_cols[edge][:, None] + sprite.cols
+                inside = (edge_rows >= 0) & (edge_rows < height) & (edge_cols >= 0) & (edge_cols < width)
+                pixels.append((edge_rows * width + edge_cols)[inside])
+                shape_index.append((indices[edge], inside.sum(axis=1)))
+                indices, sprite_rows, sprite_cols = indices[~edge], sprite_rows[~edge], sprite_cols[~edge]
+            pixels.append(((sprite_rows * width + sprite_cols)[:, None] + (sprite.rows * width + sprite.cols)).ravel())
+            shape_index.append((indices, len(sprite.rows)))
+        pixels = np.concatenate(pixels)
+        if len(pixels) == 0:
+            return
+        uniform = (palette == palette[0]).all()
+        if not uniform:
+            # NOTE: shape indices are stored plus one, so 0 is a pixel that is not covered
+            shape_index = np.concatenate([np.repeat(indices + 1, counts) for indices, counts in shape_index])
+        if owners is not None:
+            # pixels of shapes drawn directly after the shape keep their colour. Only the few pixels covered by
+            # shapes drawn directly in this frame are checked, their shapes are found from the number of pixels of
+            # every shape
+            owned = np.flatnonzero(owners.reshape(-1)[pixels] > order[0])
+            if uniform:
+                ends = np.cumsum(np.concatenate([np.broadcast_to(counts, len(indices)) for indices, counts in shape_index]))
+                owned_index = np.concatenate([indices for indices, counts in shape_index])[np.searchsorted(ends, owned, side="right")] + 1
+            else:
+                owned_index = shape_index[owned]
+            visible = order[owned_index - 1] > owners.reshape(-1)[pixels[owned]]
+            hidden, owned = owned[~visible], owned[visible]
+        else:
+            hidden = owned = pixels[:0]
+        # the rows covered by the batch
+        top, bottom = pixels.min() // width, pixels.max() // width + 1
+        if uniform and len(pixels) * DENSE_COVERAGE >= (bottom - top) * width:
+            # dense batches are composed in a mask of the rows they cover, which OpenCV copies much faster than numpy
+            # writes pixel by pixel. The pixels of other shapes with the same colour drawn after the shape drawn
+            # directly are covered again
+            band = buffer[top:bottom]
+            local = pixels - top * width
+            covered = np.zeros(band.shape[0] * width, np.uint8)
+            covered[local] = 1
+            covered[local[hidden]] = 0
+            covered[local[owned]] = 1
+            # NOTE: filling an image with a colour is much faster row by row than pixel by pixel
+            image = np.empty(band.shape, buffer.dtype)
+            image[:] = np.broadcast_to(palette[0], band.shape[1:]).copy()
+            cv2.copyTo(image, covered.reshape(band.shape[:2]), band)
+            return
+        if len(hidden):
+            drawn = np.ones(len(pixels), bool)
+            drawn[hidden] = False
+            pixels = pixels[drawn]
+            if not uniform:
+                shape_index = shape_index[drawn]
+        if not uniform:
+            # z-buffer of drawing order, every pixel gets the value of the last shape that covers it.
+            # NOTE: numpy does not define which of repeated indices is written last, so the pixels where a shape
+            # drawn later lost are written again with np.maximum.at, which is much slower for all pixels
+            z_buffer = self._take_scratch("z_buffer", (height * width,))
+            z_buffer[pixels] = shape_index
+            lost = z_buffer[pixels] < shape_index
+            np.maximum.at(z_buffer, pixels[lost], shape_index[lost])
+            if len(pixels) < (bottom - top) * width:
+                last = z_buffer[pixels] == shape_index
+                z_buffer[pixels] = 0
+                self._return_scratch("z_buffer", z_buffer)
+                self._scatter(buffer, pixels[last], palette.take(shape_index[last] - 1, axis=0))
+                return
+            # batches that cover the rows they span more than once are composed in an image of the rows
+            band = buffer[top:bottom]
+            z_band = z_buffer[top * width:bottom * width].reshape(band.shape[:2])
+            covered = (z_band > 0).view(np.uint8)
+            cv2.copyTo(palette.take(z_band - 1, axis=0).reshape(band.shape), covered, band)
+            z_band[:] = 0
+            self._return_scratch("z_buffer", z_buffer)
+            return
+        # every covered pixel gets the same value, so the order of the shapes does not matter
+        self._scatter(buffer, pixels, palette[0])
+
+    def _take_owners(self, shape, count):
+        """
+        Returns an owner map and the number of the first of count shapes drawn on it. The map is not cleared between
+        frames, the shapes of every frame are numbered after the shapes of the frames before, so the numbers of older
+        shapes are smaller.
+        """
+        with self._lock:
+            owners, first = self._owners.pop(shape, (None, 1))
+        if owners is None or first + count > np.iinfo(np.int32).max:
+            owners, first = np.zeros(shape, np.int32), 1
+        return owners, first
+
+    def _take_scratch(self, name, shape):
+        """
+        Returns a zeroed int32 scratch array, which is given back with _return_scratch after it is zeroed again.
+        """
+        with self._lock:
+            scratch = self._scratch.pop((name, shape), None)
+        return np.zeros(shape, np.int32) if scratch is None else scratch
+
+    def _return_scratch(self, name, scratch):
+        """
+        Keeps a zeroed scratch array for the next frame.
+        """
+        with self._lock:
+            self._scratch[(name, scratch.shape)] = scratch
+
+    @staticmethod
+    def _scatter(buffer, pixels, values):
+        """
+        Writes values of shape (..., channels) to the pixels of a buffer given by flat indices. Numpy writes one
+        channel at a time faster than whole pixels.
+        """
+        height, width = buffer.shape[:2]
+        if buffer.flags.c_contiguous:
+            channels = buffer.reshape(height * width, -1)
+            index = pixels
+        else:
+            channels = buffer.reshape(height, width, -1)
+            index = (pixels // width, pixels % width)
+        for channel in range(channels.shape[-1]):
+            channels[..., channel][index] = values[..., channel]
+
+    def stats(self):
+        """
+        Returns the hit/miss statistics and the memory use of the cache.
+
+        Returns
+        -------
+        dict
+            hits, misses, evictions, the number of cached sprites and the bytes they use.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "sprites": len(self._sprites), "bytes": self._nbytes}
+
+    def clear(self):
+        """
+        Removes all stamps and resets the statistics.
+        """
+        with self._lock:
+            self._sprites.clear()
+            self._offsets.clear()
+            self._owners.clear()
+            self._scratch.clear()
+            self._nbytes = 0
+            self.hits = self.misses = self.evictions = 0
@@ -1,9 +1,15 @@
+import gc
+import threading
+import time
 import unittest
+from unittest import mock
 import numpy as np
 import cv2
 
 from frame import Frame
-from shapes import Point, Shape, Circle, Rectangle, Triangle
+from shapes import Point, Shape, Circle, Rectangle, Triangle, Polygon, Group, rotation_matrix, translation_matrix
+from parallel import SceneQueries
+from sprites import SpriteCache
 
 class TestShapes(unittest.TestCase):
 
@@ -73,6 +79,507 @@ class TestShapes(unittest.TestCase):
         self.triangle.remove_from_frame()
         self.assertNotIn(self.triangle, self.frame.list_of_shapes)
 
+class TestDoubleBufferedFrame(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(200, 100, "DoubleBuffered", double_buffered=True)
+        self.circle = Circle(Point(50, 50), self.frame, 10, (0, 0, 255))
+
+    def tearDown(self):
+        self.frame.stop()
+
+    def test_render_thread_does_not_keep_frame_alive(self):
+        frame = Frame(200, 100, "Collected", double_buffered=True)
+        Circle(Point(50, 50), frame, 10)
+        frame.show()
+        frame.flush()
+        thread = frame._render_thread
+        del frame
+        gc.collect()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+    def test_show_renders_snapshot(self):
+        self.frame.show()
+        # updates after show() must not leak into the submitted frame
+        self.circle.update(Point(150, 50), 10)
+        self.frame.flush()
+        self.assertEqual(tuple(self.frame()[50, 50]), (0, 0, 255))
+        self.assertEqual(tuple(self.frame()[50, 150]), (0, 0, 0))
+
+        self.frame.show()
+        self.frame.flush()
+        self.assertEqual(tuple(self.frame()[50, 50]), (0, 0, 0))
+        self.assertEqual(tuple(self.frame()[50, 150]), (0, 0, 255))
+
+    def test_window_is_used_from_caller_thread(self):
+        threads = []
+        with mock.patch("cv2.imshow", lambda *args: threads.append(threading.current_thread())), mock.patch("cv2.waitKey", lambda *args: -1):
+            for _ in range(3):
+                self.frame.show()
+            self.frame.flush()
+        self.assertEqual(threads, [threading.current_thread()] * 3)
+
+    def test_preallocated_buffer_holds_latest_frame(self):
+        out = np.zeros((100, 200, 3), np.uint8)
+        self.frame.set_render_target("bgr", out)
+        for x in (50, 100, 150):
+            self.circle.update(Point(x, 50), 10)
+            self.frame.show()
+            self.frame.flush()
+            self.assertIs(self.frame(), out)
+            self.assertEqual(tuple(out[50, x]), (0, 0, 255))
+            self.assertEqual(np.count_nonzero(out.any(axis=2)[:, :x - 20]), 0)
+
+    def test_snapshot_is_detached(self):
+        triangle = Triangle(Point(10, 10), Point(20, 20), Point(30, 10), self.frame)
+        snap = triangle.snapshot()
+        triangle.update(Point(0, 0), Point(1, 1), Point(2, 0))
+        self.assertEqual(snap.point1.x, 10)
+        self.assertNotIn(snap, self.frame.list_of_shapes)
+
+class TestRenderTargets(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(200, 100, "RenderTargets")
+        self.circle = Circle(Point(50, 50), self.frame, 10, (0, 0, 255))
+        self.rectangle = Rectangle(Point(150, 50), 20, 20, self.frame)
+
+    def test_frame_buffer_is_reused(self):
+        buffer = self.frame()
+        self.frame.refresh()
+        self.assertIs(self.frame(), buffer)
+
+    def test_mask_target(self):
+        self.frame.set_render_target("mask")
+        self.frame.refresh()
+        self.assertEqual(self.frame().shape, (100, 200))
+        self.assertEqual(self.frame()[50, 50], 255)
+        self.assertEqual(self.frame()[50, 150], 255)
+        self.assertEqual(self.frame()[0, 0], 0)
+
+    def test_label_target_with_preallocated_buffer(self):
+        out = np.full((100, 200), 7, np.uint16)
+        self.frame.set_render_target("label", out)
+        self.frame.refresh()
+        self.assertIs(self.frame(), out)
+        self.assertEqual(out[50, 50], 1)
+        self.assertEqual(out[50, 150], 2)
+        self.assertEqual(out[0, 0], 0)
+
+    def test_mismatched_buffer(self):
+        with self.assertRaises(ValueError):
+            self.frame.set_render_target("mask", np.zeros((100, 200, 3), np.uint8))
+        with self.assertRaises(ValueError):
+            self.frame.set_render_target("label", np.zeros((100, 200), np.float32))
+
+class TestTransforms(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(800, 600, "Transforms")
+        self.rectangle = Rectangle(Point(400, 300), 100, 200, self.frame)
+        self.circle = Circle(Point(400, 300), self.frame, 50)
+        self.triangle = Triangle(Point(200, 200), Point(250, 250), Point(300, 200), self.frame)
+
+    def test_move(self):
+        self.circle.move(10, -20)
+        self.assertEqual((self.circle.center.x, self.circle.center.y), (410, 280))
+        self.triangle.move(5, 5)
+        self.assertEqual((self.triangle.point2.x, self.triangle.point2.y), (255, 255))
+        self.assertEqual(self.triangle.center.x, 255)
+
+    def test_rotate_matches_rotation_degrees(self):
+        expected = Rectangle(Point(400, 300), 100, 200, self.frame, 30).get_points()
+        self.rectangle.rotate(30)
+        self.assertAlmostEqual(self.rectangle.rotation_degrees, 30)
+        np.testing.assert_array_equal(np.sort(self.rectangle.get_points(), axis=0), np.sort(expected, axis=0))
+
+    def test_scale(self):
+        self.circle.scale(2)
+        self.rectangle.scale(0.5, Point(0, 0))
+        self.assertEqual(self.circle.radius, 100)
+        self.assertEqual((self.rectangle.center.x, self.rectangle.center.y), (200, 150))
+        self.assertAlmostEqual(self.rectangle.width, 100)
+        self.assertAlmostEqual(self.rectangle.height, 50)
+
+    def test_frame_transform(self):
+        self.frame.transform(None, rotation_matrix(90, (400, 300)))
+        self.assertEqual((self.circle.center.x, self.circle.center.y), (400, 300))
+        self.assertAlmostEqual(self.rectangle.rotation_degrees, 90)
+        self.assertEqual((self.triangle.point1.x, self.triangle.point1.y), (500, 100))
+
+        self.frame.transform([1], translation_matrix(100, 0))
+        self.assertEqual(self.circle.center.x, 500)
+        self.assertEqual(self.rectangle.center.x, 400)
+
+    def test_repeated_small_rotations(self):
+        triangle = Triangle(Point(100, 100), Point(150, 100), Point(125, 140), self.frame)
+        polygon = Polygon([Point(100, 100), Point(150, 100), Point(125, 140)], self.frame)
+        circle = Circle(Point(450, 300), self.frame, 10)
+        for _ in range(360):
+            triangle.rotate(1, Point(400, 300))
+            polygon.rotate(1, Point(400, 300))
+            circle.rotate(1, Point(400, 300))
+            circle.scale(1.01)
+        np.testing.assert_array_equal(triangle.get_points(), [[100, 100], [150, 100], [125, 140]])
+        np.testing.assert_array_equal(polygon.get_points(), [[100, 100], [150, 100], [125, 140]])
+        self.assertEqual((circle.center.x, circle.center.y), (450, 300))
+        self.assertEqual(circle.radius, round(10 * 1.01 ** 360))
+
+    def test_transform_after_update(self):
+        self.triangle.rotate(45, Point(0, 0))
+        self.triangle.update(Point(10, 10), Point(20, 10), Point(15, 20))
+        self.triangle.move(1, 0)
+        np.testing.assert_array_equal(self.triangle.get_points(), [[11, 10], [21, 10], [16, 20]])
+
+    def test_frame_transform_after_update(self):
+        circles = [Circle(Point(10 * i, 10), self.frame, 5) for i in range(6)]
+        self.frame.transform(None, rotation_matrix(33, (400, 300)))
+        circles[2].update(Point(50, 50), 5)
+        circles[4].update(Point(70, 70), 5)
+        self.frame.transform(None, translation_matrix(1, 2))
+        self.assertEqual((circles[2].center.x, circles[2].center.y), (51, 52))
+        self.assertEqual((circles[4].center.x, circles[4].center.y), (71, 72))
+        self.frame.transform(None, rotation_matrix(-33, (401, 302)))
+        self.assertEqual([(circle.center.x, circle.center.y) for i, circle in enumerate(circles) if i not in (2, 4)],
+                         [(1, 12), (11, 12), (31, 12), (51, 12)])
+
+    def test_frame_transform_speed(self):
+        # NOTE: measured on 100k circles, Frame.transform takes about 0.1s, 20 times less than calling move() on
+        # every circle and about twice as long as an update() loop, which keeps no float geometry
+        frame = Frame(800, 600, "TransformSpeed")
+        circles = [Circle(Point(i % 800, i % 600), frame, 3) for i in range(5000)]
+        frame.transform(None, translation_matrix(1, 1))
+        start = time.perf_counter()
+        frame.transform(None, translation_matrix(1, 1))
+        transform_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for circle in circles:
+            circle.move(-2, -2)
+        move_time = time.perf_counter() - start
+        self.assertLess(transform_time, move_time / 4)
+        self.assertEqual([(circle.center.x, circle.center.y) for circle in circles[:3]], [(0, 0), (1, 1), (2, 2)])
+
+class TestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(800, 600, "Group")
+        self.body = Rectangle(Point(0, 0), 20, 60, self.frame)
+        self.wheel = Circle(Point(20, 10), self.frame, 10, (0, 0, 255))
+        self.vehicle = Group(self.frame, [self.body, self.wheel], translation_matrix(100, 100))
+
+    def test_children_leave_frame(self):
+        self.assertEqual(self.frame.list_of_shapes, [self.vehicle])
+        self.assertIs(self.wheel.parent, self.vehicle)
+
+    def test_contains_uses_local_transform(self):
+        self.assertTrue(self.vehicle.contains(Point(120, 110)))
+        self.assertFalse(self.vehicle.contains(Point(20, 10)))
+        self.vehicle.move(100, 0)
+        self.assertTrue(self.vehicle.contains(Point(220, 110)))
+        self.assertFalse(self.vehicle.contains(Point(120, 110)))
+
+    def test_bounds_are_cached_and_invalidated(self):
+        self.assertEqual(self.vehicle.get_bounds(), (70, 90, 130, 120))
+        self.assertIs(self.vehicle.get_bounds(), self.vehicle.get_bounds())
+        self.wheel.update(Point(20, 10), 30)
+        self.assertEqual(self.vehicle.get_bounds(), (70, 80, 150, 140))
+
+    def test_nested_group_and_rotation(self):
+        outer = Group(self.frame, [self.vehicle])
+        outer.rotate(90, Point(100, 100))
+        self.assertTrue(outer.contains(Point(90, 120)))
+        self.assertFalse(outer.contains(Point(120, 110)))
+
+    def test_overlaps(self):
+        near = Circle(Point(135, 110), self.frame, 10)
+        far = Circle(Point(400, 400), self.frame, 10)
+        self.assertTrue(self.vehicle.overlaps(near))
+        self.assertTrue(near.overlaps(self.vehicle))
+        self.assertFalse(self.vehicle.overlaps(far))
+
+    def test_draw(self):
+        self.frame.refresh()
+        self.assertEqual(tuple(self.frame()[110, 120]), (0, 0, 255))
+        self.assertEqual(tuple(self.frame()[100, 90]), (255, 255, 255))
+        self.assertEqual(tuple(self.frame()[10, 20]), (0, 0, 0))
+
+    def test_world_shapes_are_cached_and_invalidated(self):
+        outer = Group(self.frame, [self.vehicle])
+        shapes = outer.get_world_shapes()
+        self.assertEqual([id(shape) for shape in outer.get_world_shapes()], [id(shape) for shape in shapes])
+        self.wheel.move(100, 0)
+        self.assertTrue(outer.contains(Point(220, 110)))
+        outer.move(0, 100)
+        self.assertTrue(outer.contains(Point(220, 210)))
+        self.assertFalse(outer.contains(Point(220, 110)))
+
+    def test_contains_after_move_keeps_world_shapes(self):
+        outer = Group(self.frame, [self.vehicle])
+        outer.get_world_shapes()
+        cache = outer._world_cache
+        outer.move(0, 100)
+        self.assertTrue(outer.contains(Point(120, 210)))
+        self.assertFalse(outer.contains(Point(120, 110)))
+        self.assertIs(outer._world_cache, cache)
+
+    def test_rotate_and_scale_around_bounds_center(self):
+        self.vehicle.rotate(180)
+        np.testing.assert_allclose(self.vehicle.get_bounds(), (70, 90, 130, 120), atol=1e-9)
+        self.assertTrue(self.vehicle.contains(Point(80, 100)))
+        self.vehicle.scale(2)
+        np.testing.assert_allclose(self.vehicle.get_bounds(), (40, 75, 160, 135), atol=1e-9)
+
+class TestTimeOfImpact(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(800, 600, "TimeOfImpact")
+        self.wall = Rectangle(Point(100, 50), 100, 2, self.frame)
+        self.ball = Circle(Point(0, 50), self.frame, 5)
+
+    def test_circle_tunnels_through_thin_rectangle(self):
+        previous = self.ball.snapshot()
+        self.ball.update(Point(200, 50), 5)
+        self.assertFalse(self.ball.overlaps(self.wall))
+        t, other = self.ball.time_of_impact(previous)
+        self.assertIs(other, self.wall)
+        self.assertAlmostEqual(t, 94 / 200)
+
+    def test_rectangle_against_circle(self):
+        self.wall.remove_from_frame()
+        box = Rectangle(Point(300, 50), 10, 10, self.frame)
+        previous = box.snapshot()
+        box.move(-600, 0)
+        t, other = box.time_of_impact(previous)
+        self.assertIs(other, self.ball)
+        self.assertAlmostEqual(t, 290 / 600)
+
+    def test_circle_against_circle(self):
+        other = Circle(Point(100, 150), self.frame, 10)
+        previous = self.ball.snapshot()
+        self.ball.update(Point(200, 250), 5)
+        t, hit = self.ball.time_of_impact(previous, [other])
+        self.assertIs(hit, other)
+        self.assertAlmostEqual(t, (np.hypot(100, 100) - 15) / np.hypot(200, 200))
+
+    def test_no_impact(self):
+        previous = self.ball.snapshot()
+        self.ball.update(Point(0, 300), 5)
+        self.assertIsNone(self.ball.time_of_impact(previous))
+
+    def test_already_overlapping(self):
+        self.ball.update(Point(100, 50), 5)
+        previous = self.ball.snapshot()
+        self.assertEqual(self.ball.time_of_impact(previous, [self.wall])[0], 0)
+
+    def test_group_against_triangle(self):
+        triangle = Triangle(Point(300, 0), Point(310, 100), Point(320, 0), self.frame)
+        group = Group(self.frame, [self.ball])
+        previous = group.snapshot()
+        group.move(400, 0)
+        t, other = group.time_of_impact(previous, [triangle])
+        self.assertIs(other, triangle)
+        self.assertAlmostEqual(t, 0.75, places=2)
+
+class TestPolygon(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(800, 600, "Polygon")
+        # U shape with a 100x150 notch open at the top
+        self.u_shape = Polygon([Point(100, 100), Point(150, 100), Point(150, 250), Point(250, 250),
+                                Point(250, 100), Point(300, 100), Point(300, 300), Point(100, 300)], self.frame)
+
+    def test_cached_data(self):
+        self.assertEqual(self.u_shape.triangles.shape, (6, 3))
+        self.assertEqual(self.u_shape.get_bounds(), (100, 100, 300, 300))
+        self.assertAlmostEqual(self.u_shape.area(), 200 * 200 - 100 * 150)
+
+    def test_contains(self):
+        self.assertTrue(self.u_shape.contains(Point(125, 150)))
+        self.assertFalse(self.u_shape.contains(Point(200, 150)))
+        np.testing.assert_array_equal(self.u_shape.contains_points([[125, 150], [200, 150], [200, 275], [0, 0]]), [True, False, True, False])
+
+    def test_outline_is_inside(self):
+        outline = [Point(100, 100), Point(150, 100), Point(125, 140)]
+        polygon = Polygon(outline, self.frame)
+        triangle = Triangle(*outline, self.frame)
+        for point in [Point(150, 100), Point(125, 140), Point(125, 100), Point(145, 108), Point(105, 108)]:
+            self.assertTrue(polygon.contains(point))
+            self.assertEqual(polygon.contains(point), triangle.contains(point))
+        self.assertFalse(polygon.contains(Point(151, 100)))
+        np.testing.assert_array_equal(self.frame.hit_test([[150, 100], [125, 140]], processes=1), [2, 2])
+
+    def test_overlaps_inside_notch(self):
+        inside_notch = Rectangle(Point(200, 175), 50, 50, self.frame)
+        across_notch = Rectangle(Point(200, 175), 20, 160, self.frame)
+        self.assertFalse(self.u_shape.overlaps(inside_notch))
+        self.assertFalse(inside_notch.overlaps(self.u_shape))
+        self.assertTrue(self.u_shape.overlaps(across_notch))
+
+    def test_overlaps_circle(self):
+        self.assertFalse(Circle(Point(200, 150), self.frame, 40).overlaps(self.u_shape))
+        self.assertTrue(Circle(Point(200, 150), self.frame, 60).overlaps(self.u_shape))
+        self.assertTrue(self.u_shape.overlaps(Circle(Point(200, 280), self.frame, 5)))
+
+    def test_overlaps_polygon(self):
+        inside = Polygon([Point(110, 290), Point(120, 280), Point(130, 290)], self.frame)
+        outside = Polygon([Point(400, 400), Point(410, 400), Point(405, 410)], self.frame)
+        self.assertTrue(self.u_shape.overlaps(inside))
+        self.assertTrue(inside.overlaps(self.u_shape))
+        self.assertFalse(self.u_shape.overlaps(outside))
+
+    def test_transform(self):
+        self.u_shape.move(100, 0)
+        self.assertEqual(self.u_shape.get_bounds(), (200, 100, 400, 300))
+        self.assertTrue(self.u_shape.contains(Point(225, 150)))
+        self.assertFalse(self.u_shape.contains(Point(300, 150)))
+
+class TestSpriteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(200, 100, "SpriteCache")
+        # runs of markers, partly outside the frame
+        for i in range(41):
+            Point(5 * i - 2, 1 + i % 3).draw_point(self.frame, radius=3, colour=(0, 0, 255))
+        for i in range(40):
+            rectangle = Rectangle(Point(20 + 4 * i, 70), 6, 10, self.frame, 30)
+            rectangle.set_colour((0, 255, 0))
+        Circle(Point(100, 50), self.frame, 30, (255, 0, 0))
+        Triangle(Point(10, 40), Point(30, 60), Point(50, 40), self.frame)
+
+    def assert_same_as_direct(self, render_target):
+        self.frame.set_render_target(render_target)
+        self.frame.refresh()
+        direct = self.frame().copy()
+        self.frame.sprite_cache = SpriteCache(min_batch_size=1)
+        self.frame.refresh()
+        np.testing.assert_array_equal(self.frame(), direct)
+
+    def test_same_as_direct_drawing(self):
+        for render_target in ("bgr", "mask", "label"):
+            self.assert_same_as_direct(render_target)
+
+    def test_stats(self):
+        self.frame.sprite_cache = SpriteCache(min_batch_size=1)
+        self.frame.refresh()
+        # one stamp for the points and one for the rectangles, the large circle is drawn directly
+        self.assertEqual(self.frame.sprite_cache.stats()["misses"], 2)
+        self.assertEqual(self.frame.sprite_cache.stats()["hits"], 81)
+        self.assertEqual(self.frame.sprite_cache.stats()["sprites"], 2)
+        self.frame.refresh()
+        self.assertEqual(self.frame.sprite_cache.stats()["misses"], 2)
+        self.assertEqual(self.frame.sprite_cache.stats()["hits"], 162)
+
+    def test_small_frames_drawn_directly(self):
+        self.frame.sprite_cache = SpriteCache()
+        self.frame.refresh()
+        self.assertEqual(self.frame.sprite_cache.stats()["hits"], 0)
+        self.assertEqual(self.frame.sprite_cache.stats()["misses"], 0)
+
+    def test_overlapping_stamps(self):
+        frame = Frame(60, 40, "OverlappingSprites")
+        # interleaved, overlapping markers of two types and three colours, the last shape drawn must win
+        for i in range(30):
+            Circle(Point(5 + i, 20 + i % 4), frame, 3, [(0, 0, 255), (0, 255, 0), (255, 0, 0)][i % 3])
+            Rectangle(Point(8 + i, 18), 6, 10, frame, 30).set_colour((255, 255, 255))
+        for render_target in ("bgr", "label"):
+            frame.sprite_cache = None
+            frame.set_render_target(render_target)
+            frame.refresh()
+            direct = frame().copy()
+            frame.sprite_cache = SpriteCache(min_batch_size=1)
+            frame.refresh()
+            np.testing.assert_array_equal(frame(), direct)
+            # all shapes are drawn from stamps in one batch
+            self.assertEqual(frame.sprite_cache.stats()["hits"], 60)
+
+    def test_shapes_drawn_directly_between_stamps(self):
+        frame = Frame(60, 40, "DirectBetweenSprites")
+        # triangles drawn directly over some markers and under others
+        for i in range(30):
+            Circle(Point(5 + i, 20), frame, 3, [(0, 0, 255), (0, 255, 0)][i % 2])
+            if i % 10 == 5:
+                Triangle(Point(i, 15), Point(i + 6, 25), Point(i + 12, 15), frame)
+        for render_target in ("bgr", "mask", "label"):
+            frame.sprite_cache = None
+            frame.set_render_target(render_target)
+            frame.refresh()
+            direct = frame().copy()
+            frame.sprite_cache = SpriteCache(min_batch_size=1)
+            frame.refresh()
+            np.testing.assert_array_equal(frame(), direct)
+            # the owner map is reused by the next frame
+            frame.refresh()
+            np.testing.assert_array_equal(frame(), direct)
+            self.assertEqual(frame.sprite_cache.stats()["hits"], 60)
+
+    def test_memory_cap(self):
+        self.frame.refresh()
+        direct = self.frame().copy()
+        cache = SpriteCache(min_batch_size=1)
+        cache.draw_shapes(self.frame.list_of_shapes, self.frame())
+        # room for one of the two stamps only
+        self.frame.sprite_cache = SpriteCache(max_bytes=cache.stats()["bytes"] - 1, min_batch_size=1)
+        self.frame.refresh()
+        stats = self.frame.sprite_cache.stats()
+        self.assertEqual(stats["sprites"], 1)
+        self.assertGreater(stats["evictions"], 0)
+        self.assertLessEqual(stats["bytes"], self.frame.sprite_cache.max_bytes)
+        np.testing.assert_array_equal(self.frame(), direct)
+
+class TestSceneQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.frame = Frame(800, 600, "SceneQueries")
+        self.rectangle = Rectangle(Point(400, 300), 100, 200, self.frame)
+        self.circle = Circle(Point(400, 300), self.frame, 50)
+        self.triangle = Triangle(Point(200, 200), Point(250, 250), Point(300, 200), self.frame)
+        self.far_circle = Circle(Point(700, 500), self.frame, 20)
+        self.group = Group(self.frame, [Circle(Point(0, 0), self.frame, 10)], translation_matrix(710, 500))
+        self.points = np.array([[400, 300], [310, 300], [250, 210], [685, 500], [715, 500], [10, 10]])
+        self.expected_hits = [1, 0, 2, 3, 4, -1]
+        self.expected_pairs = [[0, 1], [3, 4]]
+
+    def test_in_process(self):
+        np.testing.assert_array_equal(self.frame.hit_test(self.points, processes=1), self.expected_hits)
+        np.testing.assert_array_equal(self.frame.overlapping_pairs(processes=1), self.expected_pairs)
+
+    def test_process_pool(self):
+        with SceneQueries(self.frame.list_of_shapes, processes=2, min_parallel_size=1) as queries:
+            np.testing.assert_array_equal(queries.hit_test(self.points), self.expected_hits)
+            np.testing.assert_array_equal(queries.overlapping_pairs(), self.expected_pairs)
+
+    def test_boundaries(self):
+        frame = Frame(200, 200, "SceneBoundaries")
+        circle = Circle(Point(100, 100), frame, 10)
+        self.assertTrue(circle.contains(Point(110, 100)))
+        # points on and near the outline are hit like in Circle.contains
+        grid = [[x, y] for x in range(88, 113) for y in range(88, 113)]
+        expected = [0 if circle.contains(Point(x, y)) else -1 for x, y in grid]
+        np.testing.assert_array_equal(frame.hit_test(grid, processes=1), expected)
+        # touching shapes do not overlap, in the scene queries as in Shape.overlaps
+        touching = Circle(Point(130, 100), frame, 20)
+        self.assertFalse(circle.overlaps(touching))
+        self.assertEqual(len(frame.overlapping_pairs(processes=1)), 0)
+        frame = Frame(200, 200, "SceneTouching")
+        first = Rectangle(Point(100, 100), 20, 20, frame)
+        second = Rectangle(Point(120, 100), 20, 20, frame)
+        self.assertFalse(first.overlaps(second))
+        self.assertEqual(len(frame.overlapping_pairs(processes=1)), 0)
+
+    def test_matches_shape_overlaps(self):
+        frame = Frame(400, 400, "SceneMatches")
+        rng = np.random.default_rng(0)
+        shapes = []
+        for i in range(150):
+            x, y = rng.integers(0, 400, 2).tolist()
+            if i % 2:
+                shapes.append(Rectangle(Point(x, y), int(rng.integers(5, 40)), int(rng.integers(5, 40)), frame, float(rng.choice([0, 30, 45]))))
+            else:
+                shapes.append(Triangle(Point(x, y), Point(x + 20, y + int(rng.integers(5, 30))), Point(x + int(rng.integers(5, 30)), y), frame))
+        expected = [[i, j] for i in range(len(shapes)) for j in range(i + 1, len(shapes)) if shapes[i].overlaps(shapes[j])]
+        np.testing.assert_array_equal(frame.overlapping_pairs(processes=1), np.array(expected).reshape(-1, 2))
+
 if __name__ == "__main__":
     unittest.main()
 